@@ -0,0 +1,232 @@
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+ANN_TRAIN_ITERATIONS = int(os.getenv("ANN_TRAIN_ITERATIONS", "10"))
+ANN_TRAIN_SAMPLE = int(os.getenv("ANN_TRAIN_SAMPLE", "100000"))
+# Retrain instead of inserting into the old lists once this share of rows is new
+ANN_RETRAIN_FRACTION = float(os.getenv("ANN_RETRAIN_FRACTION", "0.3"))
+
+Hits = Tuple[np.ndarray, np.ndarray]  # (row ids, scores), best first
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    # argpartition is O(n); only the k survivors get sorted
+    n = scores.shape[-1]
+    if top_k >= n:
+        return np.argsort(-scores, axis=-1)
+    part = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1)
+    return np.take_along_axis(part, order, axis=-1)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def default_nlist(rows: int) -> int:
+    # ~4 * sqrt(n) lists keeps list scans and the centroid scan both small
+    return max(1, min(rows, int(4 * np.sqrt(rows))))
+
+
+class ExactIndex:
+    """Brute-force scan; every query scores every row in range."""
+
+    name = "exact"
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, top_k: int, rows: slice = None) -> List[Hits]:
+        rows = rows or slice(0, len(matrix))
+        # A slice of the (memmapped) matrix is a view, so a partition search copies nothing
+        scores = queries @ matrix[rows].T
+        top = top_k_indices(scores, top_k)
+        return [(top[b] + rows.start, scores[b, top[b]]) for b in range(len(queries))]
+
+
+class IVFIndex:
+    """Inverted file over unit vectors: spherical k-means centroids, one id list per centroid.
+
+    A query scores the centroids, then only the rows in its `nprobe` nearest lists.
+    The vectors themselves stay in the caller's matrix (e.g. the store memmap).
+    """
+
+    name = "ivf"
+
+    def __init__(self, centroids: np.ndarray, labels: np.ndarray, nprobe: int = ANN_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self._set_labels(np.asarray(labels, dtype=np.int32))
+
+    def _set_labels(self, labels: np.ndarray) -> None:
+        self.labels = labels
+        # Row ids grouped by list; list c is _order[_offsets[c]:_offsets[c + 1]]
+        self._order = np.argsort(labels, kind="stable")
+        self._offsets = np.searchsorted(labels[self._order], np.arange(len(self.centroids) + 1))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @staticmethod
+    def assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 65536) -> np.ndarray:
+        labels = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk):
+            block = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+            labels[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int = None, iterations: int = ANN_TRAIN_ITERATIONS,
+              sample: int = ANN_TRAIN_SAMPLE, nprobe: int = ANN_NPROBE, seed: int = 0) -> "IVFIndex":
+        n = len(vectors)
+        nlist = min(nlist or default_nlist(n), n)
+        rng = np.random.default_rng(seed)
+        # k-means on a sample; every row is assigned afterwards
+        picked = np.sort(rng.choice(n, min(n, max(sample, nlist)), replace=False))
+        train = np.asarray(vectors[picked], dtype=np.float32)
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = cls.assign(train, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, train)
+            empty = np.bincount(labels, minlength=nlist) == 0
+            if empty.any():
+                # Re-seed dead centroids from random points rather than leave empty lists
+                sums[empty] = train[rng.choice(len(train), int(empty.sum()), replace=False)]
+            centroids = _normalize(sums)
+        return cls(centroids, cls.assign(vectors, centroids), nprobe=nprobe)
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate([self._order[self._offsets[c]:self._offsets[c + 1]] for c in probe])
+
+    def search(self, matrix: np.ndarray, queries: np.ndarray, top_k: int, rows: slice = None,
+               nprobe: int = None) -> List[Hits]:
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        results = []
+        for q in queries:
+            # Sorted ids read the memmap front to back
+            ids = np.sort(self.candidates(q, nprobe))
+            if rows is not None:
+                ids = ids[(ids >= rows.start) & (ids < rows.stop)]
+            scores = matrix[ids] @ q if len(ids) else np.empty(0, dtype=np.float32)
+            top = top_k_indices(scores, top_k)
+            results.append((ids[top], scores[top]))
+        return results
+
+    def save(self, path: str, hashes: Sequence[str]) -> None:
+        # Row hashes let a later load keep the lists of rows that still exist
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, labels=self.labels, hashes=np.array(hashes, dtype="S"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, nprobe: int = ANN_NPROBE) -> Tuple[Optional["IVFIndex"], List[str]]:
+        if not os.path.exists(path):
+            return None, []
+        try:
+            with np.load(path) as data:
+                index = cls(data["centroids"], data["labels"], nprobe=nprobe)
+                hashes = [h.decode("ascii") for h in data["hashes"]]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Ignoring unreadable ANN index {path}: {e}")
+            return None, []
+        return index, hashes
+
+
+def sync_ivf(path: str, matrix: np.ndarray, hashes: List[str], nprobe: int = ANN_NPROBE) -> IVFIndex:
+    """IVF index for `matrix`, reusing the one at `path` where its rows still exist."""
+    old, old_hashes = IVFIndex.load(path, nprobe=nprobe)
+    if old is not None and old_hashes == hashes:
+        print(f"[INFO] Loaded ANN index: {len(old.centroids)} lists over {len(hashes)} rows")
+        return old
+
+    known = dict(zip(old_hashes, old.labels.tolist())) if old is not None and old.centroids.shape[1] == matrix.shape[1] else {}
+    missing = [i for i, h in enumerate(hashes) if h not in known]
+    if known and len(missing) <= ANN_RETRAIN_FRACTION * len(hashes):
+        # Incremental: surviving rows keep their lists, new rows go to the nearest centroid
+        labels = np.array([known.get(h, 0) for h in hashes], dtype=np.int32)
+        if missing:
+            labels[missing] = IVFIndex.assign(matrix[missing], old.centroids)
+        index = IVFIndex(old.centroids, labels, nprobe=nprobe)
+        print(f"[INFO] Updated ANN index: {len(missing)} rows inserted, {len(hashes)} total")
+    else:
+        start = time.perf_counter()
+        index = IVFIndex.train(matrix, nprobe=nprobe)
+        print(f"[INFO] Trained ANN index: {len(index.centroids)} lists over {len(hashes)} rows "
+              f"in {time.perf_counter() - start:.1f}s")
+    index.save(path, hashes)
+    return index
+
+
+def clustered_vectors(rows: int, dim: int, clusters: int = 256, spread: float = 0.35, seed: int = 0) -> np.ndarray:
+    """Synthetic unit vectors around random topics; real embeddings cluster, uniform noise does not."""
+    rng = np.random.default_rng(seed)
+    centers = _normalize(rng.standard_normal((clusters, dim)).astype(np.float32))
+    points = centers[rng.integers(0, clusters, rows)]
+    points += spread * rng.standard_normal((rows, dim)).astype(np.float32) / np.sqrt(dim)
+    return _normalize(points)
+
+
+def noisy_queries(data: np.ndarray, count: int, noise: float = 0.1, seed: int = 1) -> np.ndarray:
+    """Queries near, but not equal to, stored rows."""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(data), min(count, len(data)), replace=False)
+    jitter = noise * rng.standard_normal((len(picks), data.shape[1])).astype(np.float32) / np.sqrt(data.shape[1])
+    return _normalize(np.asarray(data[picks], dtype=np.float32) + jitter)
+
+
+def sweep(matrix: np.ndarray, queries: np.ndarray, top_k: int = 10,
+          nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32, 64), index: IVFIndex = None) -> Dict:
+    """Recall@k and latency of IVF at each nprobe, against the exact scan."""
+    def timed(fn) -> Tuple[List[Hits], np.ndarray]:
+        hits, latencies = [], []
+        for q in queries:
+            start = time.perf_counter()
+            hits.append(fn(q[None])[0])
+            latencies.append(time.perf_counter() - start)
+        return hits, np.array(latencies) * 1000
+
+    def latency(lat: np.ndarray) -> Dict:
+        return {"p50_ms": round(float(np.percentile(lat, 50)), 3), "p95_ms": round(float(np.percentile(lat, 95)), 3)}
+
+    start = time.perf_counter()
+    index = index or IVFIndex.train(matrix)
+    report = {"rows": len(matrix), "dim": int(matrix.shape[1]), "lists": len(index.centroids),
+              "train_s": round(time.perf_counter() - start, 3), "top_k": top_k}
+    exact = ExactIndex()
+    truth, lat = timed(lambda q: exact.search(matrix, q, top_k))
+    report["exact"] = latency(lat)
+    report["ivf"] = []
+    for nprobe in nprobes:
+        if nprobe > len(index.centroids):
+            break
+        found, lat = timed(lambda q: index.search(matrix, q, top_k, nprobe=nprobe))
+        recall = np.mean([len(set(f[0].tolist()) & set(t[0].tolist())) / len(t[0]) for f, t in zip(found, truth)])
+        report["ivf"].append({"nprobe": nprobe, f"recall@{top_k}": round(float(recall), 4), **latency(lat)})
+    return report
+
+
+# Recall-vs-latency sweep on synthetic data: python ann.py --rows 300000
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="IVF recall/latency sweep against the exact scan")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--store", help="sweep a vector store file instead of synthetic data")
+    args = parser.parse_args()
+
+    if args.store:
+        from vector_store import VectorStore
+        data = VectorStore(args.store).matrix()
+    else:
+        data = clustered_vectors(args.rows, args.dim)
+    print(json.dumps(sweep(data, noisy_queries(data, args.queries), top_k=args.top_k), indent=2))
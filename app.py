@@ -1,15 +1,27 @@
+import asyncio
+import json
+import math
 import os
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Dict
+from collections import defaultdict
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Tuple
 import chromadb
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext
+from llama_index.core import VectorStoreIndex, StorageContext, QueryBundle
 from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.embeddings.openai import OpenAIEmbedding
 import datetime as dt
-import shutil
-import time
+import metrics
+from audit import audit_log
+from cache import SemanticCache
+from ingest import language_filters
+from faq import find_faq
+from jobs import IngestionQueue
+from langid import RESPONSE_KEYS, canonical, detect_language
+from llm import get_client as get_llm_client
+from ratelimit import RateLimiter, client_key, install as install_rate_limiter
 
 app = FastAPI(title="SHEBot API", description="API for indexing and querying multiple documents using LlamaIndex and ChromaDB", version="0.1.0")
 
@@ -25,13 +37,27 @@ try:
 except ValueError:
     index = VectorStoreIndex([], storage_context=storage_context, embed_model=embed_model)
 
-MAX_REQUESTS_PER_MINUTE = 100
-request_counts = {}
+answer_cache = SemanticCache()
+# Newly indexed documents can change answers, so drop cached ones when a job lands: at once in the
+# worker that ran it, and within INDEX_STAMP_CHECK_SECONDS in the others (see _drop_stale_answers)
+ingestion_queue = IngestionQueue(index, on_done=lambda job: answer_cache.clear())
+
+MAX_REQUESTS_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "100"))
+# Per client IP, shared across workers; covers /query and /index
+rate_limiter = install_rate_limiter(app, RateLimiter(per_minute=MAX_REQUESTS_PER_MINUTE),
+                                    exempt_paths=("/health", "/metrics"))
+# Installed after the limiter so request latency includes time spent being limited
+metrics.install(app)
+metrics.gauge("shebot_answer_cache_entries", "Answers currently held in the semantic cache.",
+              lambda: {(): answer_cache.stats()["size"]})
+
+# top_k is part of the answer-cache partition key, so it takes a small, fixed set of values
+QUERY_MAX_TOP_K = int(os.getenv("QUERY_MAX_TOP_K", "20"))
 
 class QueryRequest(BaseModel):
     query: str
     user_lang: str | None = None  # "en", "sw", "sheng"
-    top_k: int = 5
+    top_k: int = Field(5, ge=1, le=QUERY_MAX_TOP_K)
 
 class QueryResponse(BaseModel):
     answer: str
@@ -39,6 +65,13 @@ class QueryResponse(BaseModel):
     retrieved: List[Dict]
     ts: str
 
+class BatchQueryRequest(BaseModel):
+    queries: List[QueryRequest]
+
+BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", "500"))
+# Generations in flight per batch request; llm.LLM_MAX_CONCURRENCY still caps the process
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "4"))
+
 SYSTEM_PROMPT = """You are SHEBot: a Kenyan women’s safety assistant.
 Follow Safety by Design: privacy-first, trauma‑informed, concise.
 If emergency keywords appear, return the emergency contacts first.
@@ -47,21 +80,13 @@ If unsure, say so and offer reputable local contacts.
 You are supportive and non‑judgmental.
 """
 
-def _llm_answer(prompt: str) -> str:
-    from google.generativeai import GenerativeModel  # Assuming Gemini as default provider
-    GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-    if GEMINI_API_KEY:
-        import google.generativeai as genai
-        genai.configure(api_key=GEMINI_API_KEY)
-    genai = GenerativeModel(GEMINI_MODEL, safety_settings={
-        'HARM_CATEGORY_HARASSMENT': 'BLOCK_MEDIUM_AND_ABOVE',
-        'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_MEDIUM_AND_ABOVE',
-        'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_MEDIUM_AND_ABOVE',
-        'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_MEDIUM_AND_ABOVE'
-    })
-    resp = genai.generate_content(prompt)
-    return resp.text
+def _embed_query(query: str):
+    with metrics.span("embedding"):
+        try:
+            return embed_model.get_query_embedding(query)
+        except Exception:
+            metrics.inc("shebot_provider_errors_total", provider="embedding")
+            raise
 
 def build_prompt(user_msg: str, retrieved_nodes: List[Dict]) -> str:
     filtered_contexts = [node for node in retrieved_nodes if node.get("score", 0) >= 0.7]
@@ -94,68 +119,269 @@ Rules:
 - Apply safety-first principles: avoid sharing personal data, focus on empowerment, and redirect to professionals for complex issues.
 """
 
-@app.post("/index")
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+def _spool_upload(file: UploadFile, dest: str) -> int:
+    written = 0
+    with open(dest, "wb") as buffer:
+        while True:
+            chunk = file.file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return written
+            buffer.write(chunk)
+            written += len(chunk)
+
+@app.post("/index", status_code=202)
 async def index_documents(files: List[UploadFile] = File(...), user_lang: str = Form(None)):
+    job = ingestion_queue.create(language=user_lang or "en")
     try:
-        temp_dir = "temp_docs"
-        os.makedirs(temp_dir, exist_ok=True)
         for file in files:
-            file_path = os.path.join(temp_dir, file.filename)
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-        
-        # Load and index multiple documents
-        documents = SimpleDirectoryReader(input_dir=temp_dir, recursive=True).load_data()
-        index.insert_nodes(documents)
-        
-        # Clean up
-        shutil.rmtree(temp_dir)
-        return JSONResponse(content={"message": f"{len(files)} documents indexed successfully", "language": user_lang or "en"})
+            # basename() keeps uploads inside the job's spool directory; the job id and file number
+            # keep two uploads with the same name from overwriting each other
+            name = os.path.basename(file.filename or "") or "upload"
+            file_path = os.path.join(job.spool_dir, f"{job.id}-{job.files}-{name}")
+            job.bytes += await run_in_threadpool(_spool_upload, file, file_path)
+            job.files += 1
     except Exception as e:
+        ingestion_queue.fail(job, str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/query", response_model=QueryResponse)
-async def query_documents(req: QueryRequest):
-    client_ip = "127.0.0.1"  # In production, use real IP
-    if client_ip not in request_counts:
-        request_counts[client_ip] = []
-    request_counts[client_ip] = [t for t in request_counts[client_ip] if time.time() - t < 60]
-    if len(request_counts[client_ip]) >= MAX_REQUESTS_PER_MINUTE:
-        raise HTTPException(status_code=429, detail="Too many requests")
-    request_counts[client_ip].append(time.time())
-
-    from safety import detect_emergency, emergency_response
-    if detect_emergency(req.query):
-        er = emergency_response()
-        lang_key = "en"
-        if req.user_lang and req.user_lang.lower().startswith("sw"):
-            lang_key = "sw"
-        elif req.user_lang and "sheng" in req.user_lang.lower():
-            lang_key = "sheng"
-        answer = er[lang_key]
-        return QueryResponse(answer=answer, used_provider="rule/emergency", retrieved=[], ts=dt.datetime.utcnow().isoformat())
-
-    query_engine = index.as_query_engine(similarity_top_k=req.top_k)
-    response = query_engine.query(req.query)
-    retrieved_nodes = [{"text": node.text, "score": node.score, "metadata": node.metadata} for node in response.source_nodes]
-    
+    # Parsing, chunking and embedding happen on the ingestion workers
+    ingestion_queue.submit(job)
+    return {"job_id": job.id, "status": job.status, "files": job.files, "language": job.language}
+
+@app.get("/index/{job_id}")
+async def index_status(job_id: str):
+    # Read from the shared job store, so whichever worker took the upload, any can answer
+    status = ingestion_queue.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return status
+
+def _now() -> str:
+    return dt.datetime.utcnow().isoformat()
+
+def _language(req: QueryRequest) -> Optional[str]:
+    # Explicit user_lang wins; otherwise identify the language locally, once per query
+    with metrics.span("detect_language"):
+        return canonical(req.user_lang) or detect_language(req.query)[0]
+
+def _shortcut(req: QueryRequest, language: Optional[str]) -> Optional[QueryResponse]:
+    """Answers that need no vectors: emergency contacts, then curated FAQ answers."""
+    from safety import find_emergency, emergency_response, with_hotlines, EMERGENCY_RESPONSE_KEYS
+    with metrics.span("detect_emergency"):
+        emergency = find_emergency(req.query)
+    lang_key = None
+    if emergency:
+        # Fall back to the language of the keyword that fired
+        lang_key = RESPONSE_KEYS.get(language) or EMERGENCY_RESPONSE_KEYS.get(emergency.group, "en")
+
+    # Near-verbatim dataset questions get their curated answer: no retrieval, no LLM rewrite.
+    # Curated questions often contain keywords ("panic", "harassment"); those keep their answer,
+    # with a hotline line ahead of it, rather than getting only the emergency text.
+    with metrics.span("faq"):
+        faq = find_faq(req.query)
+    metrics.inc("shebot_faq_lookups_total", result="miss" if faq is None else "hit")
+    if faq is not None:
+        matched = {"text": faq.question, "score": faq.score,
+                   "metadata": {"language": faq.language, "category": faq.category, "source": faq.source}}
+        answer = with_hotlines(faq.answer, lang_key) if emergency else faq.answer
+        return QueryResponse(answer=answer, used_provider="faq", retrieved=[matched], ts=_now())
+    if emergency:
+        metrics.inc("shebot_emergency_shortcircuits_total")
+        return QueryResponse(answer=emergency_response()[lang_key], used_provider="rule/emergency",
+                             retrieved=[], ts=_now())
+    return None
+
+def _drop_stale_answers() -> None:
+    if ingestion_queue.index_changed():
+        answer_cache.clear()
+
+def _cache_lang(req: QueryRequest, language: Optional[str]) -> str:
+    # Emergencies are answered before the cache and never cached; everything after may be
+    return f"{language or 'default'}:{req.top_k}"
+
+async def _generate(req: QueryRequest, cache_lang: str, query_embedding, retrieved_nodes: List[Dict]) -> QueryResponse:
     if not retrieved_nodes:
-        return QueryResponse(answer="I'm unsure. For help, contact 999 or 1195.", used_provider="llm", retrieved=[], ts=dt.datetime.utcnow().isoformat())
+        return QueryResponse(answer="I'm unsure. For help, contact 999 or 1195.", used_provider="llm", retrieved=[], ts=_now())
 
     prompt = build_prompt(req.query, retrieved_nodes)
-    answer = _llm_answer(prompt)
+    with metrics.span("llm"):
+        try:
+            # One long-lived client per process: capped concurrency, retries, identical prompts
+            # coalesced; requests wait for capacity here, not on a threadpool thread
+            answer = await get_llm_client().agenerate(prompt)
+        except Exception:
+            metrics.inc("shebot_provider_errors_total", provider="llm")
+            raise
     from safety import validate_safety_response
-    is_safe, safety_msg = validate_safety_response(answer)
+    with metrics.span("validate_safety"):
+        is_safe, safety_msg = validate_safety_response(answer)
     if not is_safe:
+        metrics.inc("shebot_safety_rejections_total", check="safety")
         answer = f"I'm sorry, I can't assist with that due to safety concerns: {safety_msg}. Please contact 999 or 1195."
-    user_keywords = set(req.query.lower().split())
-    answer_keywords = set(answer.lower().split())
-    if not user_keywords & answer_keywords and "unsure" not in answer.lower():
+    with metrics.span("keyword_overlap"):
+        user_keywords = set(req.query.lower().split())
+        answer_keywords = set(answer.lower().split())
+        off_topic = not user_keywords & answer_keywords and "unsure" not in answer.lower()
+    if off_topic:
+        metrics.inc("shebot_safety_rejections_total", check="keyword_overlap")
         answer = "I'm unsure. Please provide more details or contact 999 or 1195 for help."
 
-    current_time = dt.datetime.now().strftime("%Y-%m-%d %H:%M:%S EAT")
-    print(f"{current_time} - User: [redacted] | Answer: {answer}")
-    return QueryResponse(answer=answer, used_provider="llm", retrieved=retrieved_nodes, ts=dt.datetime.utcnow().isoformat())
+    answer_cache.put(req.query, {"answer": answer, "used_provider": "llm", "retrieved": retrieved_nodes},
+                     lang=cache_lang, embedding=query_embedding)
+    return QueryResponse(answer=answer, used_provider="llm", retrieved=retrieved_nodes, ts=_now())
+
+def _audit(route: str, req: QueryRequest, language: Optional[str], response: QueryResponse) -> None:
+    # Queued, not written: redaction and disk I/O happen on the audit writer thread
+    audit_log.log("query", route=route, query=req.query, language=language, top_k=req.top_k,
+                  provider=response.used_provider, answer=response.answer,
+                  sources=[n.get("metadata", {}).get("source") for n in response.retrieved])
+
+@app.post("/query", response_model=QueryResponse)
+async def query_documents(req: QueryRequest):
+    language = _language(req)
+    response = await _answer(req, language)
+    _audit("/query", req, language, response)
+    return response
+
+async def _answer(req: QueryRequest, language: Optional[str]) -> QueryResponse:
+    shortcut = _shortcut(req, language)
+    if shortcut is not None:
+        return shortcut
+
+    _drop_stale_answers()
+    cache_lang = _cache_lang(req, language)
+    # Embedding and Chroma are blocking calls; off the event loop, as in /query/batch
+    cached, query_embedding = await run_in_threadpool(answer_cache.get, req.query, lang=cache_lang,
+                                                      embed_fn=lambda: _embed_query(req.query))
+    metrics.inc("shebot_cache_lookups_total", result="miss" if cached is None else "hit")
+    if cached is not None:
+        return QueryResponse(**cached, ts=_now())
+
+    retrieved_nodes = await run_in_threadpool(_retrieve, req, language, query_embedding)
+    return await _generate(req, cache_lang, query_embedding, retrieved_nodes)
+
+def _retrieve(req: QueryRequest, language: Optional[str], query_embedding) -> List[Dict]:
+    # Only retrieval is needed here; the answer comes from the LLM client in _generate
+    query_bundle = QueryBundle(query_str=req.query, embedding=query_embedding)
+    with metrics.span("retrieve"):
+        nodes = index.as_retriever(similarity_top_k=req.top_k, filters=language_filters(language)).retrieve(query_bundle)
+        if not nodes and language:
+            # Nothing on-language; fall back to searching every partition
+            nodes = index.as_retriever(similarity_top_k=req.top_k).retrieve(query_bundle)
+    return [{"text": node.text, "score": node.score, "metadata": node.metadata} for node in nodes]
+
+def _embed_queries(texts: List[str]) -> List[List[float]]:
+    with metrics.span("embedding"):
+        try:
+            return embed_model.get_text_embedding_batch(texts)
+        except Exception:
+            metrics.inc("shebot_provider_errors_total", provider="embedding")
+            raise
+
+def _retrieve_batch(items: List[Tuple[List[float], Optional[str], int]]) -> List[List[Dict]]:
+    """Nodes for many (embedding, language, top_k) at once: one Chroma query per language and top_k."""
+    from llama_index.core.vector_stores.utils import metadata_dict_to_node
+
+    results: List[List[Dict]] = [[] for _ in items]
+    if not items or chroma_collection.count() == 0:
+        return results
+
+    def search(positions: List[int], language: Optional[str], top_k: int):
+        found = chroma_collection.query(query_embeddings=[items[j][0] for j in positions], n_results=top_k,
+                                        where={"language": language} if language else None,
+                                        include=["documents", "metadatas", "distances"])
+        for j, texts, metadatas, distances in zip(positions, found["documents"], found["metadatas"], found["distances"]):
+            nodes = []
+            for text, metadata, distance in zip(texts, metadatas, distances):
+                try:
+                    metadata = metadata_dict_to_node(metadata).metadata
+                except Exception:
+                    pass  # not written by llama_index; keep Chroma's metadata as-is
+                # Same distance -> score mapping as llama_index's ChromaVectorStore
+                nodes.append({"text": text, "score": math.exp(-distance), "metadata": metadata})
+            results[j] = nodes
+
+    groups = defaultdict(list)
+    for j, (_, language, top_k) in enumerate(items):
+        groups[(language, top_k)].append(j)
+    with metrics.span("retrieve"):
+        for (language, top_k), positions in groups.items():
+            search(positions, language, top_k)
+            # Nothing on-language; fall back to searching every partition
+            empty = [j for j in positions if not results[j]]
+            if empty and language:
+                search(empty, None, top_k)
+    return results
+
+@app.post("/query/batch")
+async def query_documents_batch(batch: BatchQueryRequest, request: Request):
+    """Answers for many queries as NDJSON, one line per query, in input order."""
+    reqs = batch.queries
+    if len(reqs) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+
+    # Emergency and FAQ checks over every query first; those never need vectors
+    languages = [_language(req) for req in reqs]
+    responses: List[Optional[QueryResponse]] = [_shortcut(req, lang) for req, lang in zip(reqs, languages)]
+    pending = [i for i, response in enumerate(responses) if response is None]
+
+    # The middleware charged one token for the request; every query that may reach
+    # embedding and the LLM costs one more, as it would sent to /query on its own
+    if len(pending) > rate_limiter.capacity:
+        raise HTTPException(status_code=413, detail=f"At most {int(rate_limiter.capacity)} "
+                                                    "non-FAQ queries per batch")
+    if pending:
+        allowed, retry_after = await run_in_threadpool(rate_limiter.hit, client_key(request), len(pending))
+        if not allowed:
+            raise HTTPException(status_code=429, detail="Too many requests",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+    # One embedding call for the whole batch, shared by the cache lookup and retrieval
+    embeddings = dict(zip(pending, await run_in_threadpool(_embed_queries, [reqs[i].query for i in pending]) if pending else []))
+    _drop_stale_answers()
+    cache_langs = {}
+    for i in pending:
+        cache_langs[i] = _cache_lang(reqs[i], languages[i])
+        cached, _ = answer_cache.get(reqs[i].query, lang=cache_langs[i], embed_fn=lambda i=i: embeddings[i])
+        metrics.inc("shebot_cache_lookups_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            responses[i] = QueryResponse(**cached, ts=_now())
+
+    to_answer = [i for i in pending if responses[i] is None]
+    nodes = dict(zip(to_answer, await run_in_threadpool(
+        _retrieve_batch, [(embeddings[i], languages[i], reqs[i].top_k) for i in to_answer])))
+
+    slots = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def answer(i: int) -> QueryResponse:
+        if responses[i] is not None:
+            return responses[i]
+        async with slots:
+            return await _generate(reqs[i], cache_langs[i], embeddings[i], nodes[i])
+
+    tasks = [asyncio.ensure_future(answer(i)) for i in range(len(reqs))]
+
+    async def lines():
+        try:
+            # Each line goes out as soon as it and everything before it is done
+            for i, task in enumerate(tasks):
+                try:
+                    response = await task
+                    _audit("/query/batch", reqs[i], languages[i], response)
+                    line = {"index": i, **response.model_dump()}
+                except Exception as e:
+                    print(f"[ERROR] Batch query {i} failed: {e}")
+                    audit_log.log("query_error", route="/query/batch", query=reqs[i].query, error=str(e))
+                    line = {"index": i, "error": str(e)}
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+        finally:
+            # Client went away: stop generating answers nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 @app.get("/health")
 async def health():
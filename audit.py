@@ -0,0 +1,204 @@
+import atexit
+import datetime as dt
+import gzip
+import json
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+import metrics
+
+# Off by default; when on, safety.emergency_response() tells users messages are kept for review
+AUDIT_ENABLED = os.getenv("AUDIT_ENABLED", "0") == "1"
+AUDIT_DIR = os.getenv("AUDIT_DIR", "./audit")
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "256"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_ROTATE_BYTES = int(os.getenv("AUDIT_ROTATE_BYTES", str(16 * 1024 * 1024)))  # uncompressed
+AUDIT_KEEP_FILES = int(os.getenv("AUDIT_KEEP_FILES", "30"))
+# Helplines the bot itself hands out; never mistaken for a user's number
+AUDIT_PUBLIC_NUMBERS = {n.strip() for n in os.getenv("AUDIT_PUBLIC_NUMBERS", "0722178177").split(",") if n.strip()}
+
+# Kenyan mobile/landline-style numbers: +254 / 254 / 0, then 7xx or 1xx and six digits
+PHONE_RE = re.compile(r"(?<![\d+])(?:\+?254|0)[\s.-]?[17]\d{2}[\s.-]?\d{3}[\s.-]?\d{3}(?!\d)")
+# Decimal lat,long pairs ("-1.2921, 36.8219", map links) and labelled ones ("lat -1.29 lon 36.82")
+COORDS_RE = re.compile(
+    r"-?\d{1,2}\.\d{3,}\s*,\s*-?\d{1,3}\.\d{3,}"
+    r"|\b(?:lat(?:itude)?)\s*[:=]?\s*-?\d{1,2}\.\d+\s*[,;]?\s*(?:lo?ng?(?:itude)?)\s*[:=]?\s*-?\d{1,3}\.\d+",
+    re.IGNORECASE)
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# Names after self-introductions (English, Swahili, Sheng) and titles, as (cue, name) pairs.
+# Explicit cues take the next words in any case; looser ones ("I am", "call me") only a capitalised
+# word, so "I am scared" and "call me on Monday" stay readable.
+_ANY_NAME = r"[^\W\d_]+(?:[\s-]+(?!(?i:and|na|but|lakini|from|kutoka|i|am|nina|here)\b)[^\W\d_]+){0,2}"
+_CAPITALISED_NAME = r"[A-Z][^\W\d_]+(?:\s+[A-Z][^\W\d_]+){0,2}"
+NAME_CUES = [
+    (r"(?i:\b(?:my name is|my name's|i am called|naitwa|jina langu ni|majina yangu ni|na(?:ku)?itwa|ni mimi)\s+)",
+     _ANY_NAME),
+    (r"(?i:\b(?:call me|i am|i[’']m|mimi ni)\s+)", _CAPITALISED_NAME),
+    (r"\b(?:Mr|Mrs|Ms|Miss|Dr|Bw|Bi|Mama|Baba)\.?\s+", _CAPITALISED_NAME),
+]
+NAME_RE = re.compile("|".join(f"(?P<cue{i}>{cue}){name}" for i, (cue, name) in enumerate(NAME_CUES)))
+
+
+def _phone(match: re.Match) -> str:
+    digits = re.sub(r"\D", "", match.group())
+    local = "0" + digits[3:] if digits.startswith("254") else digits
+    return match.group() if local in AUDIT_PUBLIC_NUMBERS else "[phone]"
+
+
+def _name(match: re.Match) -> str:
+    # Keep the cue ("my name is", "Dr.") so reviewers still see what was said
+    cue = next(c for c in match.groupdict().values() if c is not None)
+    return cue + "[name]"
+
+
+def redact(text: Optional[str]) -> Optional[str]:
+    if not text:
+        return text
+    text = EMAIL_RE.sub("[email]", text)
+    text = COORDS_RE.sub("[location]", text)
+    text = PHONE_RE.sub(_phone, text)
+    return NAME_RE.sub(_name, text)
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {k: _redact_value(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact_value(v) for v in value]
+    return value
+
+
+class AuditLog:
+    """Structured events -> bounded queue -> background writer -> rotated, gzipped JSONL.
+
+    log() never blocks: when the queue is full the event is dropped and counted.
+    Redaction and I/O both happen on the writer thread, off the request path.
+    """
+
+    def __init__(self, directory: str = AUDIT_DIR, queue_size: int = AUDIT_QUEUE_SIZE,
+                 batch_size: int = AUDIT_BATCH_SIZE, flush_seconds: float = AUDIT_FLUSH_SECONDS,
+                 rotate_bytes: int = AUDIT_ROTATE_BYTES, keep_files: int = AUDIT_KEEP_FILES,
+                 enabled: bool = True):
+        self.enabled = enabled
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.rotate_bytes = rotate_bytes
+        self.keep_files = keep_files
+        self.written = 0
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[Dict]]" = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._file_bytes = 0
+        self._file_day = None
+        self._files_opened = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def log(self, event: str, **fields) -> bool:
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self._start()
+        try:
+            # Only a timestamp is taken here; formatting and redaction wait for the writer
+            self._queue.put_nowait({"ts": time.time(), "event": event, **fields})
+            return True
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc("shebot_audit_dropped_total")
+            return False
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch: List[Dict] = []
+            try:
+                item = self._queue.get(timeout=self.flush_seconds)
+            except queue.Empty:
+                continue
+            # Drain whatever else is waiting, up to one batch, so a burst costs one write
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            stopping = item is None
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    metrics.inc("shebot_audit_dropped_total", len(batch))
+                    print(f"[ERROR] Audit write failed, {len(batch)} events lost: {e}")
+        self._close_file()
+
+    def _write(self, batch: List[Dict]) -> None:
+        lines = []
+        for event in batch:
+            event = _redact_value(event)
+            event["ts"] = dt.datetime.fromtimestamp(event["ts"], dt.timezone.utc).isoformat(timespec="milliseconds")
+            lines.append(json.dumps(event, ensure_ascii=False) + "\n")
+        data = "".join(lines).encode("utf-8")
+        day = time.strftime("%Y%m%d")
+        if self._file is None or self._file_bytes + len(data) > self.rotate_bytes or day != self._file_day:
+            self._rotate(day)
+        self._file.write(data)
+        # Sync-flush so a crash loses at most the batch in flight, and readers see whole lines
+        self._file.flush()
+        self._file_bytes += len(data)
+        self.written += len(batch)
+        metrics.inc("shebot_audit_events_total", len(batch))
+
+    def _rotate(self, day: str) -> None:
+        self._close_file()
+        # The pid keeps workers sharing the directory out of each other's files
+        self._files_opened += 1
+        name = f"audit-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._files_opened:04d}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), "ab")
+        self._file_bytes = 0
+        self._file_day = day
+        files = sorted(f for f in os.listdir(self.directory) if f.startswith("audit-") and f.endswith(".jsonl.gz"))
+        for old in files[:max(0, len(files) - self.keep_files)]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued events and stop the writer."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+audit_log = AuditLog(enabled=AUDIT_ENABLED)
@@ -0,0 +1,376 @@
+"""Offline latency/throughput benchmarks for the query and ingestion paths.
+
+Embedding and LLM providers are replaced with stubs that return
+deterministic vectors/text after a fixed latency, so no API keys or network
+are needed. Each target runs in its own subprocess inside a scratch working
+directory, which keeps startup time and peak RSS honest and leaves the
+repo's chroma/cache files alone.
+
+    python bench.py                          # all targets, results -> bench_results.json
+    python bench.py --targets kb app_query --concurrency 32
+    python bench.py --compare old.json       # print deltas against an earlier run
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Dict, List
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+TARGETS = ("kb", "ann", "faq", "main_query", "app_query", "app_index")
+
+
+# ---------------------------------------------------------------- measurement
+
+def summarize(latencies: List[float], wall: float, errors: int = 0) -> Dict:
+    lat = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(float(np.percentile(lat, 50)), 3),
+        "p95_ms": round(float(np.percentile(lat, 95)), 3),
+        "p99_ms": round(float(np.percentile(lat, 99)), 3),
+        "rps": round(len(latencies) / wall, 2) if wall else 0.0,
+    }
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+
+async def drive(send, items, concurrency: int) -> Dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(item):
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            response = await send(item)
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code >= 400
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def load_questions(limit: int) -> List[str]:
+    import pandas as pd
+    from ingest import CSV_FILES
+
+    questions = []
+    for path in CSV_FILES:
+        questions.extend(pd.read_csv(path)["Question"].astype(str).tolist())
+    return questions[:limit] if limit else questions
+
+
+# ---------------------------------------------------------------- stubs
+
+def install_stubs(cfg: Dict) -> None:
+    """Swap the HuggingFace/OpenAI embeddings and Gemini LLMs for fixed-latency fakes."""
+    from typing import Any
+
+    from llama_index.core.base.embeddings.base import BaseEmbedding
+    from llama_index.core.llms import CompletionResponse, CustomLLM, LLMMetadata
+    from llama_index.core.llms.callbacks import llm_completion_callback
+
+    from embeddings import FakeProvider
+
+    fake = FakeProvider(dim=cfg["dim"])
+    embed_latency, llm_latency, tokens = cfg["embed_latency"], cfg["llm_latency"], cfg["llm_tokens"]
+
+    class StubEmbedding(BaseEmbedding):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(model_name="stub")
+
+        def _one(self, text: str):
+            time.sleep(embed_latency)
+            return fake.vector(text).tolist()
+
+        def _get_query_embedding(self, query: str):
+            return self._one(query)
+
+        def _get_text_embedding(self, text: str):
+            return self._one(text)
+
+        def _get_text_embeddings(self, texts: List[str]):
+            time.sleep(embed_latency)  # one round trip per batch
+            return [fake.vector(t).tolist() for t in texts]
+
+        async def _aget_query_embedding(self, query: str):
+            return self._one(query)
+
+    class StubLLM(CustomLLM):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__()
+
+        @property
+        def metadata(self) -> LLMMetadata:
+            return LLMMetadata(model_name="stub")
+
+        @llm_completion_callback()
+        def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+            time.sleep(llm_latency)
+            return CompletionResponse(text=" ".join(["answer"] * tokens))
+
+        @llm_completion_callback()
+        def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+            text = ""
+            for _ in range(tokens):
+                time.sleep(llm_latency / tokens)
+                text += "answer "
+                yield CompletionResponse(text=text, delta="answer ")
+
+    _patch_module("llama_index.embeddings.huggingface", HuggingFaceEmbedding=StubEmbedding)
+    _patch_module("llama_index.embeddings.openai", OpenAIEmbedding=StubEmbedding)
+    _patch_module("llama_index.llms.google_genai", GoogleGenAI=StubLLM)
+    _patch_module("google.generativeai", configure=lambda **kwargs: None)
+    os.environ.setdefault("GEMINI_API_KEY", "bench-stub")
+    # app.py generates through llm.get_client(); read when llm is first imported
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ["FAKE_LLM_LATENCY"] = str(llm_latency)
+    os.environ["FAKE_LLM_TOKENS"] = str(tokens)
+
+
+def _patch_module(name: str, **attrs) -> None:
+    # Provider SDKs (torch, openai, google) need not be installed to benchmark around them
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = types.ModuleType(name)
+        sys.modules[name] = module
+        parent, _, child = name.rpartition(".")
+        if parent in sys.modules:
+            setattr(sys.modules[parent], child, module)
+    for attr, value in attrs.items():
+        setattr(module, attr, value)
+
+
+# ---------------------------------------------------------------- targets
+
+def bench_kb(cfg: Dict) -> Dict:
+    os.environ["PROVIDER"] = "fake"
+    os.environ["KNOWLEDGE_STORE"] = "knowledge.vec"  # data/ is the repo's, keep the store in the scratch dir
+    os.environ["FAKE_EMBED_LATENCY"] = str(cfg["embed_latency"])
+    start = time.perf_counter()
+    from lexical import evaluate
+    from rag import CSVKnowledgeBase
+    kb = CSVKnowledgeBase()
+    startup = time.perf_counter() - start
+
+    questions = load_questions(cfg["requests"])
+    result = {"startup_s": round(startup, 3), "rows": len(kb.df)}
+    for mode in ("dense", "hybrid"):
+        latencies = []
+        start = time.perf_counter()
+        for q in questions:
+            t = time.perf_counter()
+            kb.query(q, top_k=cfg["top_k"], mode=mode)
+            latencies.append(time.perf_counter() - t)
+        result[mode] = summarize(latencies, time.perf_counter() - start)
+    # The same questions through query_batch(): one embed call and one multiply per partition
+    start = time.perf_counter()
+    kb.query_batch(questions, top_k=cfg["top_k"])
+    elapsed = time.perf_counter() - start
+    result["hybrid_batch"] = {"requests": len(questions), "total_s": round(elapsed, 3),
+                              "rps": round(len(questions) / elapsed, 2) if elapsed else 0.0}
+    result["recall"] = evaluate(kb, top_k=cfg["top_k"])
+    return result
+
+
+async def _http_bench(app, send_factory, items, cfg: Dict) -> Dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        return await drive(send_factory(client), items, cfg["concurrency"])
+
+
+def bench_main_query(cfg: Dict) -> Dict:
+    install_stubs(cfg)
+    start = time.perf_counter()
+    import main
+    startup = time.perf_counter() - start
+    # The ASGI transport does not run the lifespan hook, so warm up here and time it
+    main.load_resources()
+    ready = time.perf_counter() - start
+    questions = load_questions(cfg["requests"])
+    result = asyncio.run(_http_bench(
+        main.app, lambda client: (lambda q: client.get("/query", params={"query": q})), questions, cfg))
+    return {"startup_s": round(startup, 3), "ready_s": round(ready, 3), **result}
+
+
+def _import_app(cfg: Dict):
+    install_stubs(cfg)
+    start = time.perf_counter()
+    import app as app_module
+    startup = time.perf_counter() - start
+    return app_module, startup
+
+
+def bench_app_query(cfg: Dict) -> Dict:
+    app_module, startup = _import_app(cfg)
+    questions = load_questions(cfg["requests"])
+    result = asyncio.run(_http_bench(
+        app_module.app, lambda client: (lambda q: client.post("/query", json={"query": q, "top_k": cfg["top_k"]})),
+        questions, cfg))
+    return {"startup_s": round(startup, 3), **result}
+
+
+def bench_app_index(cfg: Dict) -> Dict:
+    import httpx
+    from ingest import CSV_FILES
+
+    app_module, startup = _import_app(cfg)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            job_ids = []
+
+            async def upload(path):
+                with open(path, "rb") as f:
+                    files = {"files": (os.path.basename(path).replace(".csv", ".txt"), f.read(), "text/plain")}
+                response = await client.post("/index", files=files)
+                if response.status_code < 400:
+                    job_ids.append(response.json()["job_id"])
+                return response
+
+            start = time.perf_counter()
+            upload_stats = await drive(upload, CSV_FILES, cfg["concurrency"])
+            jobs = [app_module.ingestion_queue.get(job_id) for job_id in job_ids]
+            while any(job.status not in ("done", "failed") for job in jobs):
+                await asyncio.sleep(0.05)
+            total = time.perf_counter() - start
+            nodes = sum(job.nodes_done for job in jobs)
+            return {
+                "upload": upload_stats,
+                "jobs": [job.to_dict() for job in jobs],
+                "total_s": round(total, 3),
+                "nodes": nodes,
+                "nodes_per_second": round(nodes / total, 2) if total else 0.0,
+            }
+
+    return {"startup_s": round(startup, 3), **asyncio.run(run())}
+
+
+def bench_ann(cfg: Dict) -> Dict:
+    """IVF recall@10 and latency per nprobe against the exact scan, on a synthetic store of --ann-rows rows."""
+    from ann import clustered_vectors, noisy_queries, sweep
+
+    data = clustered_vectors(cfg["ann_rows"], cfg["dim"])
+    return sweep(data, noisy_queries(data, cfg["requests"] or 200), top_k=10)
+
+
+def bench_faq(cfg: Dict) -> Dict:
+    """FAQ hit rate, plus app.py /query latency over the dataset questions with the fast path off and on."""
+    import faq
+
+    app_module, startup = _import_app(cfg)
+    questions = load_questions(cfg["requests"])
+    result = {"startup_s": round(startup, 3), "entries": len(faq.get_faq()), "lookup": faq.evaluate(faq.get_faq())}
+    for enabled in (False, True):
+        faq.FAQ_ENABLED = enabled
+        result["on" if enabled else "off"] = asyncio.run(_http_bench(
+            app_module.app, lambda client: (lambda q: client.post("/query", json={"query": q, "top_k": cfg["top_k"]})),
+            questions, cfg))
+    result["p50_saved_ms"] = round(result["off"]["p50_ms"] - result["on"]["p50_ms"], 3)
+    return result
+
+
+def run_worker(target: str, cfg: Dict) -> Dict:
+    sys.path.insert(0, REPO_DIR)
+    if not cfg["with_cache"]:
+        os.environ["CACHE_MAX_ENTRIES"] = "0"  # measure the pipeline, not the answer cache
+    if not cfg["with_faq"]:
+        os.environ["FAQ_ENABLED"] = "0"  # bench questions come from the dataset and would all hit it
+    os.environ["RATE_LIMIT_PER_MINUTE"] = str(10 ** 9)
+    result = {"kb": bench_kb, "ann": bench_ann, "faq": bench_faq, "main_query": bench_main_query, "app_query": bench_app_query,
+              "app_index": bench_app_index}[target](cfg)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def spawn(target: str, cfg: Dict) -> Dict:
+    # Scratch dir with the real data, so chroma/cache/spool files never touch the repo
+    with tempfile.TemporaryDirectory(prefix=f"bench-{target}-") as workdir:
+        for name in ("data", "templates"):
+            os.symlink(os.path.join(REPO_DIR, name), os.path.join(workdir, name))
+        proc = subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, "bench.py"), "--worker", target, "--config", json.dumps(cfg)],
+            cwd=workdir, capture_output=True, text=True,
+        )
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def compare(old: Dict, new: Dict, prefix: str = "") -> None:
+    for key, value in new.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict) and isinstance(old.get(key), dict):
+            compare(old[key], value, f"{path}.")
+        elif isinstance(value, (int, float)) and isinstance(old.get(key), (int, float)) and old[key] != value:
+            change = (value - old[key]) / old[key] * 100 if old[key] else float("inf")
+            print(f"{path:55s} {old[key]:>12} -> {value:<12} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=TARGETS)
+    parser.add_argument("--requests", type=int, default=0, help="queries per target (0 = every CSV row)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="stub embedding latency, seconds")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="stub LLM latency, seconds")
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--ann-rows", type=int, default=100000, help="synthetic store size for the ann target")
+    parser.add_argument("--with-cache", action="store_true", help="leave the answer cache on")
+    parser.add_argument("--with-faq", action="store_true", help="leave the FAQ fast path on")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to diff against")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, json.loads(args.config))))
+        return
+
+    cfg = {"requests": args.requests, "concurrency": args.concurrency, "top_k": args.top_k,
+           "embed_latency": args.embed_latency, "llm_latency": args.llm_latency, "llm_tokens": args.llm_tokens,
+           "dim": args.dim, "ann_rows": args.ann_rows, "with_cache": args.with_cache, "with_faq": args.with_faq}
+    results = {
+        "meta": {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "machine": platform.machine(), "config": cfg},
+    }
+    for target in args.targets:
+        print(f"[INFO] Benchmarking {target}...")
+        results[target] = spawn(target, cfg)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps({k: v for k, v in results.items() if k != "meta"}, indent=2))
+    print(f"[INFO] Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
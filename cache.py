@@ -0,0 +1,178 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.92"))
+
+_PUNCT_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    t = _PUNCT_RE.sub(" ", query.lower())
+    return _SPACE_RE.sub(" ", t).strip()
+
+
+def _unit(vec) -> Optional[np.ndarray]:
+    if vec is None:
+        return None
+    v = np.asarray(vec, dtype=np.float32).ravel()
+    norm = np.linalg.norm(v)
+    return v / norm if norm else None
+
+
+class _Partition:
+    def __init__(self, name: str):
+        self.name = name
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._matrix = None
+        self._keys = None
+
+    def invalidate(self):
+        self._matrix = None
+        self._keys = None
+
+    def matrix(self):
+        # Rebuilt lazily after a put/evict so lookups stay a single matrix-vector product
+        if self._matrix is None:
+            keyed = [(k, e["vec"]) for k, e in self.entries.items() if e["vec"] is not None]
+            self._keys = [k for k, _ in keyed]
+            self._matrix = np.stack([v for _, v in keyed]) if keyed else np.empty((0, 0), dtype=np.float32)
+        return self._keys, self._matrix
+
+
+class SemanticCache:
+    """LRU + TTL answer cache, partitioned by language.
+
+    Lookup is exact on the normalized query first, then nearest neighbour on
+    the query embedding within the same language partition. max_entries bounds
+    the whole cache: the least recently used entry goes first, whatever its partition.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 similarity_threshold: float = CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._partitions: Dict[str, _Partition] = {}
+        # (partition, key) in recency order across every partition, for the global LRU bound
+        self._order: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _partition(self, lang: Optional[str], create: bool = False) -> Optional[_Partition]:
+        # Lookups never create partitions; only put() does, and _drop() removes empty ones
+        key = (lang or "default").lower()
+        part = self._partitions.get(key)
+        if part is None and create:
+            part = self._partitions[key] = _Partition(key)
+        return part
+
+    def _touch(self, part: _Partition, key: str) -> None:
+        part.entries.move_to_end(key)
+        self._order[(part.name, key)] = None
+        self._order.move_to_end((part.name, key))
+
+    def _drop(self, part: _Partition, key: str) -> None:
+        del part.entries[key]
+        self._order.pop((part.name, key), None)
+        part.invalidate()
+        if not part.entries:
+            # Partitions come and go with their entries, so their number stays bounded too
+            del self._partitions[part.name]
+
+    def _expired(self, entry: Dict, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry["ts"] > self.ttl_seconds
+
+    def get(self, query: str, lang: Optional[str] = None,
+            embed_fn: Optional[Callable[[], Any]] = None) -> Tuple[Optional[Any], Optional[Any]]:
+        """Return (value, embedding).
+
+        embed_fn is only called when the exact lookup misses; the embedding it
+        produced is returned so the caller can reuse it for retrieval.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            part = self._partition(lang)
+            entry = self._exact(part, key, time.monotonic()) if part is not None else None
+            if entry is not None:
+                self.hits += 1
+                return entry["value"], None
+        if embed_fn is None:
+            with self._lock:
+                self.misses += 1
+            return None, None
+
+        # Embed outside the lock; it may be a network call
+        embedding = embed_fn()
+        vec = _unit(embedding)
+        with self._lock:
+            part = self._partition(lang)
+            entry = self._nearest(part, vec, time.monotonic()) if part is not None else None
+            if entry is None:
+                self.misses += 1
+                return None, embedding
+            self._touch(part, entry["key"])
+            self.hits += 1
+            self.semantic_hits += 1
+            return entry["value"], embedding
+
+    def _exact(self, part: _Partition, key: str, now: float) -> Optional[Dict]:
+        entry = part.entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, now):
+            self._drop(part, key)
+            return None
+        self._touch(part, key)
+        return entry
+
+    def _nearest(self, part: _Partition, vec, now: float) -> Optional[Dict]:
+        if vec is None:
+            return None
+        keys, matrix = part.matrix()
+        if not keys or matrix.shape[1] != vec.shape[0]:
+            return None
+        scores = matrix @ vec
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        entry = part.entries[keys[best]]
+        if self._expired(entry, now):
+            self._drop(part, keys[best])
+            return None
+        return entry
+
+    def put(self, query: str, value: Any, lang: Optional[str] = None, embedding=None) -> None:
+        key = normalize_query(query)
+        with self._lock:
+            part = self._partition(lang, create=True)
+            part.entries[key] = {"key": key, "value": value, "vec": _unit(embedding), "ts": time.monotonic()}
+            self._touch(part, key)
+            part.invalidate()
+            while len(self._order) > self.max_entries:
+                oldest_part, oldest_key = next(iter(self._order))
+                self._drop(self._partitions[oldest_part], oldest_key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._partitions.clear()
+            self._order.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "size": len(self._order),
+            }
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", "./embed_cache.sqlite3")
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "4"))
+EMBED_BACKOFF_SECONDS = float(os.getenv("EMBED_BACKOFF_SECONDS", "0.5"))
+# Simulated per-batch latency of the fake provider, for benchmarks
+FAKE_EMBED_LATENCY = float(os.getenv("FAKE_EMBED_LATENCY", "0"))
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OpenAIProvider:
+    name = "openai"
+    max_batch_size = 2048  # inputs per embeddings.create call
+
+    def __init__(self, model: str, api_key: Optional[str] = None):
+        from openai import OpenAI
+        self.model = model
+        self._client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        response = self._client.embeddings.create(model=self.model, input=texts)
+        return [data.embedding for data in sorted(response.data, key=lambda d: d.index)]
+
+
+class GeminiProvider:
+    name = "gemini"
+    max_batch_size = 100  # batchEmbedContents limit
+
+    def __init__(self, model: str, task_type: str = "retrieval_document", api_key: Optional[str] = None):
+        import google.generativeai as genai
+        # Configure once per provider, not per call; with no key at all, leave any existing configuration alone
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+        self._genai = genai
+        self.model = model
+        self.task_type = task_type
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # A list of contents goes out as one batch request
+        response = self._genai.embed_content(model=self.model, content=texts, task_type=self.task_type)
+        return response["embedding"]
+
+
+class FakeProvider:
+    """Deterministic offline vectors for tests and benchmarks; no network."""
+
+    name = "fake"
+
+    def __init__(self, model: str = "fake", dim: int = 384, latency: float = 0.0, max_batch_size: int = 64):
+        self.model = model
+        self.dim = dim
+        self.latency = latency
+        self.max_batch_size = max_batch_size
+        self.calls = 0
+
+    def vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        v = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+        return v / np.linalg.norm(v)
+
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.vector(t) for t in texts]
+
+
+class EmbeddingCache:
+    """Vectors on disk keyed by (provider, model, sha256(text))."""
+
+    def __init__(self, path: str = EMBED_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (provider TEXT NOT NULL, model TEXT NOT NULL, "
+                     "text_hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (provider, model, text_hash))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, provider: str, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        conn = self._conn()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(hashes), 500):
+            chunk = hashes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE provider = ? AND model = ? AND text_hash IN ({placeholders})",
+                (provider, model, *chunk),
+            )
+            for h, blob in rows:
+                found[h] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, provider: str, model: str, items: Dict[str, np.ndarray]) -> None:
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (provider, model, text_hash, vector) VALUES (?, ?, ?, ?)",
+                [(provider, model, h, np.asarray(v, dtype=np.float32).tobytes()) for h, v in items.items()],
+            )
+
+
+class EmbeddingClient:
+    """Batched, concurrent embedding with retry/backoff over a persistent cache."""
+
+    def __init__(self, provider, cache: Optional[EmbeddingCache] = None, max_workers: int = EMBED_MAX_WORKERS,
+                 max_retries: int = EMBED_MAX_RETRIES, backoff: float = EMBED_BACKOFF_SECONDS):
+        self.provider = provider
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+
+    def _embed_with_retry(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.provider.embed_batch(texts)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"Error generating embeddings with {self.provider.name}: {str(e)}")
+                # Exponential backoff with jitter so concurrent batches do not retry in lockstep
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                print(f"[WARN] Embedding batch failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        hashes = [text_hash(t) for t in texts]
+        unique = dict(zip(hashes, texts))
+        vectors = self.cache.get_many(self.provider.name, self.provider.model, list(unique)) if self.cache else {}
+
+        missing = [h for h in unique if h not in vectors]
+        if missing:
+            size = self.provider.max_batch_size
+            batches = [missing[i:i + size] for i in range(0, len(missing), size)]
+            futures = [self._pool.submit(self._embed_with_retry, [unique[h] for h in batch]) for batch in batches]
+            fresh = {}
+            for batch, future in zip(batches, futures):
+                for h, vec in zip(batch, future.result()):
+                    fresh[h] = np.asarray(vec, dtype=np.float32)
+            if self.cache:
+                self.cache.put_many(self.provider.name, self.provider.model, fresh)
+            vectors.update(fresh)
+
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([vectors[h] for h in hashes])
+
+
+_clients: Dict[tuple, EmbeddingClient] = {}
+_clients_lock = threading.Lock()
+
+
+def make_provider(name: str, model: str, api_key: Optional[str] = None):
+    if name == "gemini":
+        return GeminiProvider(model, api_key=api_key)
+    if name == "fake":
+        return FakeProvider(model, latency=FAKE_EMBED_LATENCY)
+    return OpenAIProvider(model, api_key=api_key)
+
+
+def get_client(provider_name: str, model: str, use_cache: bool = True, api_key: Optional[str] = None) -> EmbeddingClient:
+    # api_key=None means the provider's environment variable
+    key = (provider_name, model, use_cache, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = EmbeddingClient(make_provider(provider_name, model, api_key=api_key),
+                                                     cache=EmbeddingCache() if use_cache else None)
+        return client
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+from cache import normalize_query
+
+FAQ_ENABLED = os.getenv("FAQ_ENABLED", "1") != "0"
+# Edit-distance similarity (0..1) a fuzzy match needs before its curated answer is served as-is
+FAQ_MIN_SIMILARITY = float(os.getenv("FAQ_MIN_SIMILARITY", "0.9"))
+# Trigram overlap (Dice) below which a question is not worth an edit-distance check
+FAQ_CANDIDATE_OVERLAP = 0.5
+FAQ_MAX_CANDIDATES = 3
+
+
+class FAQMatch(NamedTuple):
+    question: str
+    answer: str
+    language: str
+    category: str
+    source: str
+    score: float
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a: str, b: str) -> float:
+    """1 - Levenshtein distance / longer length."""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return 1.0 - previous[-1] / len(a)
+
+
+class FAQIndex:
+    """Curated question -> answer lookup: exact on the normalized question, else trigram + edit distance."""
+
+    def __init__(self, entries: List[FAQMatch], min_similarity: float = FAQ_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.entries = entries
+        self._keys = [normalize_query(e.question) for e in entries]
+        self._exact: Dict[str, int] = {}
+        self._grams = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        for i, key in enumerate(self._keys):
+            self._exact.setdefault(key, i)
+            grams = _trigrams(key)
+            self._grams.append(len(grams))
+            for g in grams:
+                self._postings[g].append(i)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def match(self, query: str) -> Optional[FAQMatch]:
+        key = normalize_query(query)
+        if not key:
+            return None
+        i = self._exact.get(key)
+        if i is not None:
+            return self.entries[i]._replace(score=1.0)
+
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for g in grams:
+            for i in self._postings.get(g, ()):
+                shared[i] += 1
+        dice = {i: 2 * n / (len(grams) + self._grams[i]) for i, n in shared.items()}
+        candidates = sorted((i for i in dice if dice[i] >= FAQ_CANDIDATE_OVERLAP), key=dice.get, reverse=True)
+        best, best_score = None, 0.0
+        for i in candidates[:FAQ_MAX_CANDIDATES]:
+            other = self._keys[i]
+            # The length difference alone is a lower bound on the edit distance
+            if 1.0 - abs(len(key) - len(other)) / max(len(key), len(other)) < self.min_similarity:
+                continue
+            score = similarity(key, other)
+            if score > best_score:
+                best, best_score = i, score
+        if best is None or best_score < self.min_similarity:
+            return None
+        return self.entries[best]._replace(score=round(best_score, 4))
+
+
+def load_entries(csv_files: List[str] = None) -> List[FAQMatch]:
+    import pandas as pd
+    from ingest import CSV_FILES
+
+    entries = []
+    for path in csv_files or CSV_FILES:
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path).drop_duplicates(["Question", "Bot Response"])
+        for row in df.to_dict("records"):
+            if pd.isna(row.get("Question")) or pd.isna(row.get("Bot Response")):
+                continue
+            entries.append(FAQMatch(str(row["Question"]), str(row["Bot Response"]), str(row.get("Language", "")),
+                                    str(row.get("Category", "")), str(row.get("Source", "")), 0.0))
+    return entries
+
+
+_faq: Optional[FAQIndex] = None
+_faq_lock = threading.Lock()
+
+
+def get_faq() -> FAQIndex:
+    global _faq
+    if _faq is None:
+        with _faq_lock:
+            if _faq is None:
+                _faq = FAQIndex(load_entries())
+    return _faq
+
+
+def find_faq(query: str) -> Optional[FAQMatch]:
+    if not FAQ_ENABLED:
+        return None
+    return get_faq().match(query)
+
+
+def evaluate(faq: FAQIndex) -> Dict[str, Dict[str, float]]:
+    """Hit rate and lookup latency for dataset questions as typed, loosely retyped, and off-FAQ text."""
+    import numpy as np
+    from lexical import _variants
+
+    questions = list(dict.fromkeys(e.question for e in faq.entries))
+    cases = {
+        "exact": [(q, q) for q in questions],
+        "loose": [(_variants(q)[1], q) for q in questions],
+        # Curated answers are not questions; any hit here is a false positive
+        "off_faq": [(e.answer, None) for e in faq.entries],
+    }
+    report = {}
+    for name, items in cases.items():
+        latencies, hits, correct = [], 0, 0
+        for query, expected in items:
+            start = time.perf_counter()
+            found = faq.match(query)
+            latencies.append(time.perf_counter() - start)
+            hits += found is not None
+            correct += found is not None and found.question == expected
+        lat = np.array(latencies) * 1e6
+        report[name] = {
+            "hit_rate": round(hits / len(items), 4),
+            "correct_rate": round(correct / len(items), 4),
+            "p50_us": round(float(np.percentile(lat, 50)), 1),
+            "p95_us": round(float(np.percentile(lat, 95)), 1),
+            "queries": len(items),
+        }
+    return report
+
+
+# Hit rate and lookup cost over the dataset questions: python faq.py
+if __name__ == "__main__":
+    import json
+    print(json.dumps({"entries": len(get_faq()), **evaluate(get_faq())}, indent=2))
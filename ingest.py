@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+
+import pandas as pd
+
+CSV_FILES = ["data/knowledge.csv", "data/shebot_dataset_2000.csv", "data/shebot_mental_health_1500.csv"]
+MANIFEST_NAME = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+UPSERT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+
+def _clean(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value)
+
+
+def row_text(row: Dict) -> str:
+    answer = row.get("Bot Response", row.get("Answer", ""))
+    return (f"Category: {_clean(row.get('Category', ''))} | Question: {_clean(row.get('Question', ''))} | "
+            f"Answer: {_clean(answer)} | Language: {_clean(row.get('Language', ''))}")
+
+
+def row_id(text: str) -> str:
+    # Stable across restarts and machines: the ID only changes when the row content does
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def load_rows(csv_files: List[str] = CSV_FILES) -> Dict[str, Dict]:
+    rows = {}
+    for csv_file in csv_files:
+        if not os.path.exists(csv_file):
+            continue
+        df = pd.read_csv(csv_file)
+        for record in df.to_dict("records"):
+            text = row_text(record)
+            # Identical rows across files collapse to one vector
+            rows.setdefault(row_id(text), {
+                "text": text,
+                "source": csv_file,
+                "language": _clean(record.get("Language", "")),
+                "category": _clean(record.get("Category", "")),
+            })
+    return rows
+
+
+def load_manifest(path: str) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        print(f"[WARN] Ignoring unreadable ingest manifest: {path}")
+        return {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+    return manifest
+
+
+def save_manifest(path: str, embed_model_name: str, ids: Dict[str, str]) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "embed_model": embed_model_name, "ids": ids}, f)
+    os.replace(tmp_path, path)
+
+
+def _collection_ids(collection) -> set:
+    return set(collection.get(include=[])["ids"])
+
+
+def plan_sync(rows: Dict[str, Dict], manifest: Dict, collection, embed_model_name: str) -> Tuple[List[str], List[str]]:
+    """Return (ids_to_add, ids_to_delete) needed to bring the collection in line with the CSVs."""
+    known = set(manifest.get("ids", {}))
+    # Trust the manifest only if it was written for this model and still matches the collection
+    if (manifest.get("embed_model") != embed_model_name
+            or collection.count() != len(known)):
+        known = _collection_ids(collection)
+        if manifest and manifest.get("embed_model") not in (None, embed_model_name):
+            # Vectors from another model are not comparable; re-embed everything
+            return sorted(rows), sorted(known)
+    wanted = set(rows)
+    return sorted(wanted - known), sorted(known - wanted)
+
+
+def sync_index(collection, vector_store, embed_model, embed_model_name: str,
+               csv_files: List[str] = CSV_FILES, manifest_path: str = None):
+    from llama_index.core import VectorStoreIndex
+    from llama_index.core.schema import TextNode
+
+    manifest_path = manifest_path or os.path.join("./chroma_db_new", MANIFEST_NAME)
+    rows = load_rows(csv_files)
+    manifest = load_manifest(manifest_path)
+    to_add, to_delete = plan_sync(rows, manifest, collection, embed_model_name)
+
+    for start in range(0, len(to_delete), UPSERT_BATCH_SIZE):
+        collection.delete(ids=to_delete[start:start + UPSERT_BATCH_SIZE])
+
+    index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+    for start in range(0, len(to_add), UPSERT_BATCH_SIZE):
+        batch = to_add[start:start + UPSERT_BATCH_SIZE]
+        nodes = [
+            TextNode(
+                id_=rid,
+                text=rows[rid]["text"],
+                metadata={k: rows[rid][k] for k in ("source", "language", "category")},
+            )
+            for rid in batch
+        ]
+        index.insert_nodes(nodes)
+
+    if to_add or to_delete or not manifest:
+        save_manifest(manifest_path, embed_model_name, {rid: rows[rid]["source"] for rid in rows})
+    print(f"[INFO] Ingestion: {len(rows)} rows, {len(to_add)} embedded, {len(to_delete)} removed")
+    return index
+
+
+def language_filters(language: str = None):
+    """Metadata filter for one language partition of the collection, or None for all of them."""
+    if not language:
+        return None
+    from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+    return MetadataFilters(filters=[ExactMatchFilter(key="language", value=language)])
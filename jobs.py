@@ -0,0 +1,231 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from langid import canonical
+
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", "./spool")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_BATCH_SIZE = int(os.getenv("INDEX_JOB_BATCH_SIZE", "64"))
+MAX_TRACKED_JOBS = 500
+# Job status is shared through SQLite, so any uvicorn worker can answer GET /index/{job_id},
+# not just the one that took the upload
+INGEST_JOBS_DB = os.getenv("INGEST_JOBS_DB", "./ingest_jobs.sqlite3")
+# How often a worker looks for documents indexed by other workers
+INDEX_STAMP_CHECK_SECONDS = float(os.getenv("INDEX_STAMP_CHECK_SECONDS", "5"))
+
+
+class IngestionJob:
+    def __init__(self, job_id: str, spool_dir: str, language: Optional[str]):
+        self.id = job_id
+        self.spool_dir = spool_dir
+        self.language = language
+        self.status = "receiving"  # receiving -> queued -> parsing -> embedding -> done | failed
+        self.files = 0
+        self.bytes = 0
+        self.documents = 0
+        self.nodes_total = 0
+        self.nodes_done = 0
+        self.errors: List[str] = []
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> Dict:
+        end = self.finished or time.time()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "language": self.language,
+            "files": self.files,
+            "bytes": self.bytes,
+            "documents": self.documents,
+            "nodes_total": self.nodes_total,
+            "nodes_done": self.nodes_done,
+            "progress": round(self.nodes_done / self.nodes_total, 4) if self.nodes_total else 0.0,
+            "elapsed_seconds": round(elapsed, 3),
+            "nodes_per_second": round(self.nodes_done / elapsed, 2) if elapsed else 0.0,
+            "errors": self.errors,
+        }
+
+
+class JobStore:
+    """Latest to_dict() of every job in SQLite, readable from every worker on the host.
+
+    Also holds the time new nodes were last indexed, so every worker can tell its answers may be stale.
+    """
+
+    def __init__(self, path: str = INGEST_JOBS_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS ingest_jobs "
+                     "(id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL, data TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_created ON ingest_jobs (created)")
+        conn.execute("CREATE TABLE IF NOT EXISTS ingest_stamps (name TEXT PRIMARY KEY, value REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def save(self, job: "IngestionJob") -> None:
+        try:
+            self._conn().execute("INSERT OR REPLACE INTO ingest_jobs (id, status, created, data) VALUES (?, ?, ?, ?)",
+                                 (job.id, job.status, job.created, json.dumps(job.to_dict())))
+        except sqlite3.OperationalError as e:
+            # A missed progress update only makes the status lag; never fail the job over it
+            print(f"[WARN] Could not record ingestion job {job.id}: {e}")
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT data FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_indexed(self, when: float) -> None:
+        try:
+            self._conn().execute("INSERT OR REPLACE INTO ingest_stamps (name, value) VALUES ('indexed', ?)", (when,))
+        except sqlite3.OperationalError as e:
+            print(f"[WARN] Could not record index update: {e}")
+
+    def indexed_at(self) -> float:
+        try:
+            row = self._conn().execute("SELECT value FROM ingest_stamps WHERE name = 'indexed'").fetchone()
+        except sqlite3.OperationalError as e:
+            print(f"[WARN] Could not read index update time: {e}")
+            return 0.0
+        return row[0] if row else 0.0
+
+    def prune(self, keep: int = MAX_TRACKED_JOBS) -> None:
+        try:
+            self._conn().execute(
+                "DELETE FROM ingest_jobs WHERE status IN ('done', 'failed') AND id NOT IN "
+                "(SELECT id FROM ingest_jobs ORDER BY created DESC LIMIT ?)", (keep,))
+        except sqlite3.OperationalError as e:
+            print(f"[WARN] Skipped ingestion job pruning: {e}")
+
+
+class IngestionQueue:
+    """Runs upload parsing, chunking and embedding on a worker pool, off the request path."""
+
+    def __init__(self, index, spool_root: str = INGEST_SPOOL_DIR, workers: int = INGEST_WORKERS,
+                 batch_size: int = INGEST_BATCH_SIZE, on_done: Optional[Callable[[IngestionJob], None]] = None,
+                 store: Optional[JobStore] = None):
+        self.index = index
+        self.store = store or JobStore()
+        self.on_done = on_done
+        self.spool_root = spool_root
+        self.batch_size = batch_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexed_seen = self.store.indexed_at()
+        self._indexed_checked = time.monotonic()
+
+    def create(self, language: Optional[str] = None) -> IngestionJob:
+        job_id = uuid.uuid4().hex
+        # Each job gets its own spool directory, so concurrent uploads never share files
+        spool_dir = os.path.join(self.spool_root, job_id)
+        os.makedirs(spool_dir)
+        job = IngestionJob(job_id, spool_dir, language)
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        self.store.save(job)
+        self.store.prune()
+        return job
+
+    def _prune(self) -> None:
+        # Forget the oldest finished jobs once too many are tracked
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= MAX_TRACKED_JOBS:
+                break
+            if self._jobs[job_id].status in ("done", "failed"):
+                del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """A job this process accepted; see status() for jobs from any worker."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        job = self.get(job_id)
+        return job.to_dict() if job is not None else self.store.load(job_id)
+
+    def index_changed(self, check_seconds: float = INDEX_STAMP_CHECK_SECONDS) -> bool:
+        """True once after any worker on the host indexes new nodes; reads SQLite at most every check_seconds."""
+        now = time.monotonic()
+        if now - self._indexed_checked < check_seconds:
+            return False
+        self._indexed_checked = now
+        stamp = self.store.indexed_at()
+        if stamp <= self._indexed_seen:
+            return False
+        self._indexed_seen = stamp
+        return True
+
+    def submit(self, job: IngestionJob) -> None:
+        job.status = "queued"
+        self.store.save(job)
+        self._pool.submit(self._run, job)
+
+    def fail(self, job: IngestionJob, error: str) -> None:
+        job.errors.append(error)
+        job.status = "failed"
+        job.finished = time.time()
+        self.store.save(job)
+        shutil.rmtree(job.spool_dir, ignore_errors=True)
+
+    def _run(self, job: IngestionJob) -> None:
+        from llama_index.core import SimpleDirectoryReader
+        from llama_index.core.node_parser import SentenceSplitter
+
+        job.started = time.time()
+        try:
+            job.status = "parsing"
+            self.store.save(job)
+            documents = SimpleDirectoryReader(input_dir=job.spool_dir, recursive=True).load_data()
+            for doc in documents:
+                # Same values as the dataset's Language column, so language routing finds them
+                doc.metadata["language"] = canonical(job.language) or "English"
+                doc.metadata["ingest_job"] = job.id
+            job.documents = len(documents)
+            nodes = SentenceSplitter().get_nodes_from_documents(documents)
+            job.nodes_total = len(nodes)
+
+            job.status = "embedding"
+            self.store.save(job)
+            for start in range(0, len(nodes), self.batch_size):
+                batch = nodes[start:start + self.batch_size]
+                try:
+                    self.index.insert_nodes(batch)
+                except Exception as e:
+                    # Keep going; one bad batch should not lose the rest of the upload
+                    job.errors.append(f"nodes {start}-{start + len(batch) - 1}: {e}")
+                    continue
+                job.nodes_done += len(batch)
+                self.store.save(job)
+            job.status = "failed" if job.errors and not job.nodes_done else "done"
+            if job.nodes_done:
+                self.store.mark_indexed(time.time())
+                if self.on_done:
+                    self.on_done(job)
+        except Exception as e:
+            job.errors.append(str(e))
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            self.store.save(job)
+            shutil.rmtree(job.spool_dir, ignore_errors=True)
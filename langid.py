@@ -0,0 +1,119 @@
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LANGID_MIN_CONFIDENCE = float(os.getenv("LANGID_MIN_CONFIDENCE", "0.8"))
+NGRAM_SIZES = (1, 2, 3)
+
+# Anything clients or older data may use for a language -> dataset `Language` value
+_ALIASES = {
+    "en": "English", "eng": "English", "english": "English",
+    "sw": "Kiswahili", "swa": "Kiswahili", "swahili": "Kiswahili", "kiswahili": "Kiswahili",
+    "sheng": "Sheng",
+}
+# Dataset `Language` value -> safety.emergency_response() key
+RESPONSE_KEYS = {"English": "en", "Kiswahili": "sw", "Sheng": "sheng"}
+
+_CLEAN_RE = re.compile(r"[^\w\s]+|\d+", re.UNICODE)
+
+
+def canonical(lang: Optional[str]) -> Optional[str]:
+    if not lang:
+        return None
+    tag = lang.strip().lower()
+    # Regional tags ("sw-KE", "en_US") fall back to their primary subtag
+    return _ALIASES.get(tag) or _ALIASES.get(re.split(r"[-_]", tag, 1)[0])
+
+
+def _ngrams(text: str) -> Counter:
+    t = " ".join(_CLEAN_RE.sub(" ", text.lower()).split())
+    grams = Counter()
+    for word in t.split():
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                grams[padded[i:i + n]] += 1
+    return grams
+
+
+class LanguageIdentifier:
+    """Multinomial naive Bayes over character 1-3 grams; no network, microseconds per query."""
+
+    def __init__(self, samples: Dict[str, Iterable[str]]):
+        self.languages = sorted(samples)
+        self._log_prob: Dict[str, Dict[str, float]] = {}
+        self._unseen: Dict[str, float] = {}
+        vocab = set()
+        counts = {}
+        for lang in self.languages:
+            c = Counter()
+            for text in samples[lang]:
+                c.update(_ngrams(text))
+            counts[lang] = c
+            vocab.update(c)
+        for lang, c in counts.items():
+            # Add-one smoothing
+            total = sum(c.values()) + len(vocab)
+            self._log_prob[lang] = {g: math.log((n + 1) / total) for g, n in c.items()}
+            self._unseen[lang] = math.log(1 / total)
+
+    def scores(self, text: str) -> Dict[str, float]:
+        grams = _ngrams(text)
+        return {
+            lang: sum(n * self._log_prob[lang].get(g, self._unseen[lang]) for g, n in grams.items())
+            for lang in self.languages
+        }
+
+    def predict(self, text: str) -> Tuple[Optional[str], float]:
+        """Return (language, confidence in 0..1); (None, 0.0) when there is nothing to go on."""
+        words = _CLEAN_RE.sub(" ", text).split()
+        if not words or not self.languages:
+            return None, 0.0
+        scores = self.scores(text)
+        # Softmax over per-word log-likelihood, so long texts don't become overconfident
+        best = max(scores, key=scores.get)
+        z = sum(math.exp((s - scores[best]) / len(words)) for s in scores.values())
+        return best, 1.0 / z
+
+
+def _training_samples() -> Dict[str, List[str]]:
+    import pandas as pd
+    from ingest import CSV_FILES
+    from safety import EMERGENCY_KEYWORDS
+
+    samples = defaultdict(list)
+    for path in CSV_FILES:
+        if not os.path.exists(path):
+            continue
+        df = pd.read_csv(path).drop_duplicates(["Question", "Bot Response"])
+        for lang, question, answer in zip(df["Language"], df["Question"], df["Bot Response"]):
+            lang = canonical(str(lang))
+            if lang:
+                samples[lang].extend([str(question), str(answer)])
+    for group, keywords in EMERGENCY_KEYWORDS.items():
+        lang = canonical(group)
+        if lang:
+            samples[lang].extend(keywords)
+    return samples
+
+
+_identifier: Optional[LanguageIdentifier] = None
+_identifier_lock = threading.Lock()
+
+
+def get_identifier() -> LanguageIdentifier:
+    global _identifier
+    if _identifier is None:
+        with _identifier_lock:
+            if _identifier is None:
+                _identifier = LanguageIdentifier(_training_samples())
+    return _identifier
+
+
+def detect_language(text: str, min_confidence: float = LANGID_MIN_CONFIDENCE) -> Tuple[Optional[str], float]:
+    """Language of `text`, or None when the identifier is not confident enough to route on it."""
+    lang, confidence = get_identifier().predict(text or "")
+    return (lang if confidence >= min_confidence else None), confidence
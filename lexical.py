@@ -0,0 +1,139 @@
+import math
+import re
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Very common English/Swahili/Sheng function words; they only add noise to BM25
+STOPWORDS = frozenset("""
+a an and are as at be by do does for from how i in is it me my of on or the to what where who why with you your
+na ya wa kwa ni la za cha vya katika je au hii hiyo huo kama kuna nini wapi gani mimi wewe yeye sisi
+""".split())
+NGRAM = 4  # sub-word grams catch Swahili/Sheng inflections ("ananifuatilia" ~ "kunifuatilia")
+
+
+def words(text: str) -> List[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def terms(text: str) -> List[str]:
+    out = []
+    for w in words(text):
+        out.append(w)
+        if len(w) > NGRAM:
+            out.extend("#" + w[i:i + NGRAM] for i in range(len(w) - NGRAM + 1))
+    return out
+
+
+class BM25Index:
+    """In-process BM25 over a fixed list of documents, with a postings list per term."""
+
+    def __init__(self, docs: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.n = len(docs)
+        self.k1 = k1
+        self.b = b
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = np.zeros(self.n, dtype=np.float32)
+        for i, doc in enumerate(docs):
+            doc_terms = terms(doc)
+            lengths[i] = len(doc_terms)
+            for t in doc_terms:
+                postings[t][i] = postings[t].get(i, 0) + 1
+        avg_len = float(lengths.mean()) if self.n else 0.0
+        norm = k1 * (1 - b + b * lengths / avg_len) if avg_len else np.full(self.n, k1, dtype=np.float32)
+
+        # Precompute each posting's BM25 weight so a search is just scatter-adds
+        self.postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self.idf: Dict[str, float] = {}
+        for t, docs_tf in postings.items():
+            ids = np.fromiter(docs_tf.keys(), dtype=np.int32, count=len(docs_tf))
+            tf = np.fromiter(docs_tf.values(), dtype=np.float32, count=len(docs_tf))
+            idf = math.log(1 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5))
+            self.idf[t] = idf
+            self.postings[t] = (ids, (idf * tf * (k1 + 1) / (tf + norm[ids])).astype(np.float32))
+
+    def scores(self, query: str) -> np.ndarray:
+        out = np.zeros(self.n, dtype=np.float32)
+        for t in terms(query):
+            posting = self.postings.get(t)
+            if posting is not None:
+                out[posting[0]] += posting[1]
+        return out
+
+    def search(self, query: str, top_k: int = 10, rows: slice = None) -> List[Tuple[int, float]]:
+        """Top BM25 hits, optionally restricted to a contiguous range of documents."""
+        scores = self.scores(query)
+        if rows is not None:
+            masked = np.zeros_like(scores)
+            masked[rows] = scores[rows]
+            scores = masked
+        hits = np.flatnonzero(scores)
+        if hits.size == 0:
+            return []
+        if hits.size > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits])]
+        return [(int(i), float(scores[i])) for i in hits]
+
+    def overlap(self, query: str, doc: str) -> float:
+        """IDF-weighted word overlap in both directions (min of the two coverages), 0..1.
+
+        Used as the confidence that `doc` is the same question as `query`.
+        """
+        q, d = set(words(query)), set(words(doc))
+        if not q or not d:
+            return 0.0
+        weight = lambda ws: sum(self.idf.get(w, 1.0) for w in ws)
+        shared = weight(q & d)
+        return min(shared / weight(q), shared / weight(d))
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = 60) -> List[Tuple[int, float]]:
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            fused[idx] += 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def _variants(question: str) -> List[str]:
+    # The question as typed plus a looser paraphrase (no punctuation, first content word dropped)
+    ws = _WORD_RE.findall(question)
+    loose = " ".join(ws[:1] + ws[2:]) if len(ws) > 3 else " ".join(ws)
+    return [question, loose.lower()]
+
+
+def evaluate(kb, top_k: int = 5) -> Dict[str, Dict[str, float]]:
+    """Recall@k and latency of each retrieval mode, using the dataset questions as queries."""
+    import time
+
+    questions = kb.columns["Question"]
+    cases = [(q, str(expected)) for expected in dict.fromkeys(questions) for q in _variants(str(expected))]
+    report = {}
+    for mode in ("dense", "hybrid", "lexical"):
+        latencies, found, fast = [], 0, 0
+        for query, expected in cases:
+            start = time.perf_counter()
+            results = kb.query(query, top_k=top_k, mode=mode)
+            latencies.append(time.perf_counter() - start)
+            found += any(r["Question"] == expected for r in results)
+            fast += bool(results) and results[0].get("retriever") == "lexical"
+        lat = np.array(latencies) * 1000
+        report[mode] = {
+            f"recall@{top_k}": round(found / len(cases), 4),
+            "p50_ms": round(float(np.percentile(lat, 50)), 3),
+            "p95_ms": round(float(np.percentile(lat, 95)), 3),
+            "lexical_fast_path_rate": round(fast / len(cases), 4),
+            "queries": len(cases),
+        }
+    return report
+
+
+# Compare dense-only against hybrid retrieval: python lexical.py
+if __name__ == "__main__":
+    import json
+    from rag import CSVKnowledgeBase
+
+    print(json.dumps(evaluate(CSVKnowledgeBase()), indent=2))
@@ -0,0 +1,219 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+import metrics
+from embeddings import text_hash
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_SECONDS = float(os.getenv("LLM_BACKOFF_SECONDS", "0.5"))
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# Simulated latency and answer length of the fake provider, for benchmarks
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "20"))
+
+# Provider errors worth another attempt: rate limits, overload and timeouts.
+# Matched by class name so google.api_core need not be importable here.
+RETRYABLE_ERRORS = {"ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+                    "DeadlineExceeded", "GatewayTimeout", "TimeoutError", "ConnectionError"}
+
+SAFETY_SETTINGS = {
+    'HARM_CATEGORY_HARASSMENT': 'BLOCK_MEDIUM_AND_ABOVE',
+    'HARM_CATEGORY_HATE_SPEECH': 'BLOCK_MEDIUM_AND_ABOVE',
+    'HARM_CATEGORY_SEXUALLY_EXPLICIT': 'BLOCK_MEDIUM_AND_ABOVE',
+    'HARM_CATEGORY_DANGEROUS_CONTENT': 'BLOCK_MEDIUM_AND_ABOVE'
+}
+
+
+class LLMBusyError(Exception):
+    """No concurrency slot freed up within the timeout."""
+
+
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, model: str = GEMINI_MODEL):
+        import google.generativeai as genai
+        # Configured and built once per process, not per request
+        api_key = os.getenv("GEMINI_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model = model
+        self._model = genai.GenerativeModel(model, safety_settings=SAFETY_SETTINGS)
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        return self._model.generate_content(prompt, request_options={"timeout": timeout}).text
+
+
+class FakeProvider:
+    """Fixed-latency canned answers for benchmarks; no network."""
+
+    name = "fake"
+
+    def __init__(self, model: str = "fake", latency: float = FAKE_LLM_LATENCY, tokens: int = FAKE_LLM_TOKENS):
+        self.model = model
+        self.latency = latency
+        self.tokens = tokens
+        self.calls = 0
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return " ".join(["answer"] * self.tokens)
+
+
+class LLMClient:
+    """Shared gate in front of an LLM: a concurrency cap, retry with backoff, and single-flight.
+
+    Concurrent calls with the same key wait on the first one instead of going upstream again.
+    Async handlers go through gate()/acall() so requests queue on the event loop, not in
+    the shared threadpool.
+    """
+
+    def __init__(self, provider=None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT_SECONDS, max_retries: int = LLM_MAX_RETRIES,
+                 backoff: float = LLM_BACKOFF_SECONDS):
+        self.provider = provider
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Admits at most as many tasks as there are slots, so the thread-side wait in slot() stays short
+        self._gate = asyncio.Semaphore(max_concurrency)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self):
+        # Wait for capacity, but fail fast rather than queue forever behind a stuck provider
+        if not self._slots.acquire(timeout=self.timeout):
+            metrics.inc("shebot_llm_rejected_total")
+            raise LLMBusyError(f"No LLM capacity within {self.timeout:.0f}s")
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def gate(self):
+        try:
+            await asyncio.wait_for(self._gate.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("shebot_llm_rejected_total")
+            raise LLMBusyError(f"No LLM capacity within {self.timeout:.0f}s")
+        try:
+            yield
+        finally:
+            self._gate.release()
+
+    def _with_retry(self, fn: Callable[[], str]) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self.slot():
+                    return fn()
+            except Exception as e:
+                if attempt == self.max_retries or type(e).__name__ not in RETRYABLE_ERRORS:
+                    raise
+                # Backoff happens outside the slot, with jitter so retries do not arrive in lockstep
+                delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+                metrics.inc("shebot_llm_retries_total")
+                print(f"[WARN] LLM call failed ({type(e).__name__}: {e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            metrics.inc("shebot_llm_coalesced_total")
+        return future, leader
+
+    def _settle(self, key: str, future: Future, result: Optional[str] = None,
+                error: Optional[BaseException] = None) -> None:
+        # Whoever settles first wins; a late leader thread must not trip over it
+        try:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        except InvalidStateError:
+            pass
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _lead(self, key: str, future: Future, fn: Callable[[], str]) -> str:
+        try:
+            result = self._with_retry(fn)
+        except Exception as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def call(self, key: str, fn: Callable[[], str]) -> str:
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+        return self._lead(key, future, fn)
+
+    async def acall(self, key: str, fn: Callable[[], str]) -> str:
+        """call() for async handlers: waits for capacity on the event loop, then runs fn on a thread."""
+        # Claimed before queueing at the gate, so identical prompts arriving meanwhile still coalesce
+        future, leader = self._claim(key)
+        if not leader:
+            # Shielded: a follower that disconnects must not cancel the shared result for everyone else
+            return await asyncio.shield(asyncio.wrap_future(future))
+        started = False
+        try:
+            async with self.gate():
+                started = True
+                return await run_in_threadpool(self._lead, key, future, fn)
+        except BaseException as e:
+            if not started:
+                # Never reached the provider (busy or cancelled); release the followers too
+                self._settle(key, future, error=e if isinstance(e, Exception) else LLMBusyError("LLM call cancelled"))
+            raise
+
+    def stream(self, tokens: Iterator[str]) -> Iterator[str]:
+        # Holds a slot until the stream is exhausted or closed
+        with self.slot():
+            yield from tokens
+
+    def generate(self, prompt: str) -> str:
+        return self.call(text_hash(prompt), lambda: self.provider.generate(prompt, timeout=self.timeout))
+
+    async def agenerate(self, prompt: str) -> str:
+        return await self.acall(text_hash(prompt), lambda: self.provider.generate(prompt, timeout=self.timeout))
+
+
+_clients: Dict[tuple, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+
+def make_provider(name: str, model: Optional[str] = None):
+    if name == "fake":
+        return FakeProvider(model or "fake")
+    return GeminiProvider(model or GEMINI_MODEL)
+
+
+def get_client(provider_name: str = None, model: Optional[str] = None) -> LLMClient:
+    provider_name = provider_name or os.getenv("LLM_PROVIDER", "gemini")
+    key = (provider_name, model)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = LLMClient(make_provider(provider_name, model))
+        return client
@@ -1,62 +1,100 @@
-import chromadb
-from llama_index.core import VectorStoreIndex, StorageContext, SimpleDirectoryReader
-from llama_index.vector_stores.chroma import ChromaVectorStore
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.llms.google_genai import GoogleGenAI
+import json
 import os
+import threading
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import google.generativeai as genai
+import metrics
+from audit import audit_log
+from cache import SemanticCache
+from embeddings import text_hash
+from faq import find_faq, get_faq
+from llm import LLMClient
+from langid import RESPONSE_KEYS, detect_language, get_identifier
+from safety import (EMERGENCY_RESPONSE_KEYS, UNSAFE_RESPONSE_MESSAGES, emergency_response, find_emergency,
+                    response_scanner, with_hotlines)
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, StreamingResponse
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
-
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-
 # Load environment variables
 load_dotenv()
 gemini_api_key = os.getenv("GEMINI_API_KEY")
+EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Heavy resources (torch, MiniLM, Chroma, the LLM client) load in a background
+# thread once the server is listening; until then these stay None.
+index = None
+llm = None
+embed_model = None
+startup = {"phase": "starting", "error": None, "started": time.time(), "ready_after_seconds": None}
+
+
+def load_resources():
+    global index, llm, embed_model
+    try:
+        # Cheap, and lets the first queries route by language and hit the FAQ straight away
+        get_identifier()
+        get_faq()
+
+        startup["phase"] = "loading_index"
+        import chromadb
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        from ingest import CSV_FILES, sync_index
+
+        # Set up ChromaDB
+        chroma_client = chromadb.PersistentClient(path="./chroma_db_new")
+        chroma_collection = chroma_client.get_or_create_collection(name="test_documents")
+        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
+
+        # Use local HuggingFace embeddings
+        embed_model = HuggingFaceEmbedding(model_name=EMBED_MODEL_NAME)
+
+        # Load the index, embedding only CSV rows that are new or changed since the last boot;
+        # with an unchanged manifest this just opens the persisted collection
+        index = sync_index(chroma_collection, vector_store, embed_model, EMBED_MODEL_NAME, csv_files=CSV_FILES)
+
+        # Initialize Gemini LLM if API key is available
+        startup["phase"] = "loading_llm"
+        if gemini_api_key:
+            import google.generativeai as genai
+            from llama_index.llms.google_genai import GoogleGenAI
+            genai.configure(api_key=gemini_api_key)
+            llm = GoogleGenAI(model="gemini-2.0-flash-exp", api_key=gemini_api_key)
+        else:
+            print("Warning: GEMINI_API_KEY not set. Gemini LLM will not work.")
+
+        startup["phase"] = "ready"
+        startup["ready_after_seconds"] = round(time.time() - startup["started"], 3)
+        print(f"[INFO] Ready after {startup['ready_after_seconds']}s")
+    except Exception as e:
+        startup["phase"] = "failed"
+        startup["error"] = str(e)
+        print(f"[ERROR] Startup failed: {e}")
+
 
-# Configure APIs if keys are available
-if gemini_api_key:
-    genai.configure(api_key=gemini_api_key)
-else:
-    print("Warning: GEMINI_API_KEY not set. Gemini LLM will not work.")
-
-# Load CSV documents (run once on startup)
-import pandas as pd
-from llama_index.core import Document
-
-# Load CSV files and convert to documents
-csv_files = ["data/knowledge.csv", "data/shebot_dataset_2000.csv", "data/shebot_mental_health_1500.csv"]
-documents = []
-
-for csv_file in csv_files:
-    if os.path.exists(csv_file):
-        df = pd.read_csv(csv_file)
-        # Combine relevant columns into text
-        for _, row in df.iterrows():
-            text = f"Category: {row.get('Category', '')} | Question: {row.get('Question', '')} | Answer: {row.get('Bot Response', row.get('Answer', ''))} | Language: {row.get('Language', '')}"
-            documents.append(Document(text=text))
-
-# Set up ChromaDB
-chroma_client = chromadb.PersistentClient(path="./chroma_db_new")
-chroma_collection = chroma_client.get_or_create_collection(name="test_documents")
-vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-
-# Use local HuggingFace embeddings
-embed_model = HuggingFaceEmbedding(model_name="sentence-transformers/all-MiniLM-L6-v2")
-storage_context = StorageContext.from_defaults(vector_store=vector_store)
-
-# Create index
-index = VectorStoreIndex.from_documents(documents, storage_context=storage_context, embed_model=embed_model)
-
-# Initialize Gemini LLM if API key is available
-if gemini_api_key:
-    llm = GoogleGenAI(model="gemini-2.0-flash-exp", api_key=gemini_api_key)
-else:
-    llm = None
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Bind immediately; warm up in the background
+    threading.Thread(target=load_resources, name="warmup", daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Answers for repeated or near-duplicate questions
+answer_cache = SemanticCache()
+# Caps concurrent LLM calls, retries throttling errors, and shares identical in-flight answers
+llm_gate = LLMClient()
+# Built once per (language partition, streaming) instead of per request
+_query_engines = {}
+
+# GET /metrics, stage histograms, and the opt-in X-Timing header
+metrics.install(app)
+metrics.gauge("shebot_answer_cache_entries", "Answers currently held in the semantic cache.",
+              lambda: {(): answer_cache.stats()["size"]})
 
 # Jinja2 templates for serving HTML
 templates = Jinja2Templates(directory="templates")
@@ -66,37 +104,243 @@ templates = Jinja2Templates(directory="templates")
 async def get_chat_interface(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+# Liveness: the process is up and serving
+@app.get("/health")
+async def health():
+    return {"status": "healthy"}
+
+# Readiness: retrieval and the LLM are usable
+@app.get("/ready")
+async def ready():
+    body = {
+        "ready": startup["phase"] == "ready" and index is not None and llm is not None,
+        "phase": startup["phase"],
+        "retrieval": index is not None,
+        "llm": llm is not None,
+        "ready_after_seconds": startup["ready_after_seconds"],
+        "error": startup["error"],
+    }
+    return JSONResponse(status_code=200 if body["ready"] else 503, content=body)
+
+SYSTEM_PROMPT = "You are She Bot, a helpful assistant for women in Kenya facing harassment and mental health challenges. Always respond in the same language as the user's query. Provide empathetic, supportive, and relevant advice based on the knowledge base."
+UNAVAILABLE_RESPONSE = "I'm sorry, the AI service is currently unavailable. Please try again later or contact support."
+WARMING_UP_RESPONSE = "She Bot is still starting up. Please try again in a moment. If you are in danger, call 999 or the GBV helpline 1195."
+GREETINGS = ["hello", "hi", "hey", "greetings", "habari", "jambo"]  # Added Swahili greetings
+SWAHILI_GREETING_WORDS = ["habari", "jambo", "niko", "sawa"]
+DEVELOPER_KEYWORDS = ["who made", "who developed", "who created", "developer", "creator"]
+DEVELOPER_CREDIT = " (Developed by Denis Pius)"
+
+
+def greeting_response(query_lower: str):
+    # Check for greetings and respond accordingly; these never need the LLM
+    if not any(greeting in query_lower for greeting in GREETINGS):
+        return None
+    # Detect language and respond in kind
+    if any(word in query_lower for word in SWAHILI_GREETING_WORDS):
+        return "Habari! Mimi ni She Bot, hapa kusaidia wanawake nchini Kenya wanaokabiliwa na unyanyasaji na changamoto za afya ya akili. Ninawezaje kukusaidia leo?"
+    return "Hello! I am She Bot, here to support women in Kenya facing harassment and mental health challenges. How can I assist you today?"
+
+
+def instant_response(query: str, query_lower: str):
+    """Replies that need neither retrieval nor the LLM, so they work before warm-up finishes."""
+    with metrics.span("detect_emergency"):
+        emergency = find_emergency(query)
+    lang_key = None
+    if emergency:
+        # Hotlines in the user's language when we can tell it
+        language, _ = detect_language(query)
+        lang_key = RESPONSE_KEYS.get(language) or EMERGENCY_RESPONSE_KEYS.get(emergency.group, "en")
+    # Near-verbatim dataset questions get their vetted answer, skipping retrieval and the LLM.
+    # Curated questions often contain keywords ("panic", "help"), so a match keeps its answer,
+    # with the hotlines ahead of it, instead of being replaced by the emergency text.
+    with metrics.span("faq"):
+        faq = find_faq(query)
+    metrics.inc("shebot_faq_lookups_total", result="miss" if faq is None else "hit")
+    if faq is not None:
+        return with_hotlines(faq.answer, lang_key) if emergency else faq.answer
+    if emergency:
+        metrics.inc("shebot_emergency_shortcircuits_total")
+        return emergency_response()[lang_key]
+    return greeting_response(query_lower)
+
+
+def not_ready_response():
+    if startup["phase"] not in ("ready", "failed"):
+        return WARMING_UP_RESPONSE
+    if index is None or llm is None:
+        # Default response if no index or LLM
+        return UNAVAILABLE_RESPONSE
+    return None
+
+
+def wants_developer_credit(query_lower: str) -> bool:
+    # Append developer credit only if asked about the developer
+    return any(keyword in query_lower for keyword in DEVELOPER_KEYWORDS)
+
+
+def _embed_query(query: str):
+    with metrics.span("embedding"):
+        try:
+            return embed_model.get_query_embedding(query)
+        except Exception:
+            metrics.inc("shebot_provider_errors_total", provider="embedding")
+            raise
+
+
+def _query_engine(language, streaming: bool):
+    key = (language, streaming)
+    engine = _query_engines.get(key)
+    if engine is None:
+        from ingest import language_filters
+        engine = _query_engines[key] = index.as_query_engine(
+            llm=llm, system_prompt=SYSTEM_PROMPT, streaming=streaming, filters=language_filters(language))
+    return engine
+
+
+def _retrieve(query: str, streaming: bool = False):
+    """Return (cached_answer, query_engine, query_bundle, nodes, cache_args).
+
+    Either the cached answer is set or the rest are ready for _synthesize();
+    cache_args are what answer_cache.put() needs to store the finished answer.
+    """
+    # Detected once per query; drives both the cache partition and the index partition
+    with metrics.span("detect_language"):
+        language, _ = detect_language(query)
+    cached, embedding = answer_cache.get(query, lang=language, embed_fn=lambda: _embed_query(query))
+    metrics.inc("shebot_cache_lookups_total", result="miss" if cached is None else "hit")
+    cache_args = {"lang": language, "embedding": embedding}
+    if cached is not None:
+        return cached, None, None, None, cache_args
+    # Reuse the embedding computed for the cache lookup instead of embedding the query twice
+    from llama_index.core import QueryBundle
+
+    query_bundle = QueryBundle(query_str=query, embedding=embedding)
+    query_engine = _query_engine(language, streaming)
+    with metrics.span("retrieve"):
+        nodes = query_engine.retrieve(query_bundle)
+        if not nodes and language:
+            # Nothing on-language; fall back to searching every partition
+            query_engine = _query_engine(None, streaming)
+            nodes = query_engine.retrieve(query_bundle)
+    return None, query_engine, query_bundle, nodes, cache_args
+
+
+def _open_stream(query_engine, query_bundle, nodes):
+    with llm_gate.slot():
+        return query_engine.synthesize(query_bundle, nodes)
+
+
+async def _synthesize(query_engine, query_bundle, nodes, cache_args, streaming: bool = False):
+    """Generate the answer; the streaming caller must already hold llm_gate.gate() for the stream's lifetime."""
+    # Requests wait for LLM capacity on the event loop; only the call itself takes a thread.
+    # With streaming=True this only opens the stream; tokens are timed in the SSE handler.
+    with metrics.span("llm"):
+        try:
+            if streaming:
+                return await run_in_threadpool(_open_stream, query_engine, query_bundle, nodes)
+            key = text_hash("\n".join([cache_args["lang"] or "", query_bundle.query_str] + [n.node.node_id for n in nodes]))
+            return await llm_gate.acall(key, lambda: query_engine.synthesize(query_bundle, nodes))
+        except Exception:
+            metrics.inc("shebot_provider_errors_total", provider="llm")
+            raise
+
+
+def _sse(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 # API endpoint for queries with custom logic
 @app.get("/query")
 async def query_document(query: str):
-    if index is None or llm is None:
-        # Default response if no index or LLM
-        base_response = "I'm sorry, the AI service is currently unavailable. Please try again later or contact support."
-    else:
-        system_prompt = "You are She Bot, a helpful assistant for women in Kenya facing harassment and mental health challenges. Always respond in the same language as the user's query. Provide empathetic, supportive, and relevant advice based on the knowledge base."
-        query_engine = index.as_query_engine(llm=llm, system_prompt=system_prompt)
-        response = query_engine.query(query)
-        base_response = str(response)
-
-    # Check for greetings and respond accordingly
-    greetings = ["hello", "hi", "hey", "greetings", "habari", "jambo"]  # Added Swahili greetings
     query_lower = query.lower().strip()
-    if any(greeting in query_lower for greeting in greetings):
-        # Detect language and respond in kind
-        if any(word in query_lower for word in ["habari", "jambo", "niko", "sawa"]):
-            base_response = "Habari! Mimi ni She Bot, hapa kusaidia wanawake nchini Kenya wanaokabiliwa na unyanyasaji na changamoto za afya ya akili. Ninawezaje kukusaidia leo?"
+    base_response = instant_response(query, query_lower) or not_ready_response()
+    source = "shortcut"
+    if base_response is None:
+        # Retrieval blocks, so keep it off the event loop
+        cached, query_engine, query_bundle, nodes, cache_args = await run_in_threadpool(_retrieve, query)
+        if cached is not None:
+            base_response, source = cached, "cache"
         else:
-            base_response = "Hello! I am She Bot, here to support women in Kenya facing harassment and mental health challenges. How can I assist you today?"
-    # No else needed, keep the base_response from above
+            response = await _synthesize(query_engine, query_bundle, nodes, cache_args)
+            base_response, source = str(response), "llm"
+            answer_cache.put(query, base_response, **cache_args)
+    audit_log.log("query", route="/query", query=query, source=source, answer=base_response)
 
-    # Append developer credit only if asked about the developer
-    developer_keywords = ["who made", "who developed", "who created", "developer", "creator"]
-    if any(keyword in query_lower for keyword in developer_keywords):
-        base_response += " (Developed by Denis Pius)"
+    if wants_developer_credit(query_lower):
+        base_response += DEVELOPER_CREDIT
 
     return {"query": query, "response": base_response}
 
 
+# Server-sent events: one `data:` message per token, then a final `done` event
+@app.get("/query/stream")
+async def query_document_stream(query: str):
+    query_lower = query.lower().strip()
+
+    async def event_stream():
+        shortcut = instant_response(query, query_lower) or not_ready_response()
+        if shortcut is not None:
+            audit_log.log("query", route="/query/stream", query=query, source="shortcut", answer=shortcut)
+            yield _sse({"token": shortcut})
+        else:
+            try:
+                cached, query_engine, query_bundle, nodes, cache_args = await run_in_threadpool(_retrieve, query, True)
+                if cached is not None:
+                    audit_log.log("query", route="/query/stream", query=query, source="cache", answer=cached)
+                    yield _sse({"token": cached})
+                else:
+                    # Held for the whole stream, like the slot llm_gate.stream() holds on its thread
+                    async with llm_gate.gate():
+                        streaming_response = await _synthesize(query_engine, query_bundle, nodes, cache_args, streaming=True)
+                        tokens = []
+                        # Holds back a few characters so an unsafe phrase is caught before any of it is sent
+                        scanner = response_scanner()
+                        start = time.perf_counter()
+                        llm_tokens = llm_gate.stream(streaming_response.response_gen)
+                        try:
+                            async for token in iterate_in_threadpool(llm_tokens):
+                                if not tokens:
+                                    metrics.observe(metrics.STAGE_METRIC, time.perf_counter() - start, stage="llm_first_token")
+                                tokens.append(token)
+                                safe = scanner.feed(token)
+                                if safe:
+                                    yield _sse({"token": safe})
+                                if scanner.match is not None:
+                                    break
+                        finally:
+                            # Stops the upstream stream and frees the LLM slot when we cut it short
+                            llm_tokens.close()
+                    safe = scanner.finish()
+                    if safe:
+                        yield _sse({"token": safe})
+                    metrics.observe(metrics.STAGE_METRIC, time.perf_counter() - start, stage="llm_stream")
+                    if scanner.match is not None:
+                        metrics.inc("shebot_safety_rejections_total", check="stream")
+                        message = UNSAFE_RESPONSE_MESSAGES[scanner.match.group]
+                        answer = (f" I'm sorry, I can't continue this answer due to safety concerns: {message} "
+                                  "Please contact 999 or 1195.")
+                        audit_log.log("query", route="/query/stream", query=query, source="llm/blocked", answer=answer)
+                        yield _sse({"token": answer})
+                    else:
+                        answer_cache.put(query, "".join(tokens), **cache_args)
+                        audit_log.log("query", route="/query/stream", query=query, source="llm", answer="".join(tokens))
+            except Exception as e:
+                metrics.inc("shebot_stream_errors_total")
+                print(f"[ERROR] Streaming query failed: {e}")
+                audit_log.log("query_error", route="/query/stream", query=query, error=str(e))
+                yield _sse({"token": UNAVAILABLE_RESPONSE})
+        if wants_developer_credit(query_lower):
+            yield _sse({"token": DEVELOPER_CREDIT})
+        yield _sse({"query": query}, event="done")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Stop proxies from buffering the stream, which would defeat the early first byte
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,149 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+# Seconds; spans run from microseconds (keyword match) to many seconds (LLM)
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+STAGE_METRIC = "shebot_stage_seconds"
+REQUEST_METRIC = "shebot_request_seconds"
+TIMING_HEADER = "X-Timing"
+UNMATCHED_PATH = "<unmatched>"
+
+_HELP = {
+    STAGE_METRIC: "Time spent in each query pipeline stage.",
+    REQUEST_METRIC: "End-to-end request latency by path.",
+}
+
+# Per-request stage timings, only collected when the client asked for X-Timing
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_gauges: Dict[str, Tuple[str, Callable[[], Dict[Tuple, float]]]] = {}
+
+
+def observe(name: str, value: float, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = Histogram()
+        hist.observe(value)
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+
+
+def gauge(name: str, help_text: str, collect: Callable[[], Dict[Tuple, float]]) -> None:
+    """Register a value read at scrape time; collect() returns {label tuple: value}."""
+    _gauges[name] = (help_text, collect)
+
+
+@contextmanager
+def span(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe(STAGE_METRIC, elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def _labels(labels: Tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render() -> str:
+    """Prometheus text exposition format (0.0.4)."""
+    lines = []
+    with _lock:
+        histograms = {k: (list(h.counts), h.sum, h.count, h.buckets) for k, h in _histograms.items()}
+        counters = dict(_counters)
+
+    seen = set()
+    for (name, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {_HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip(list(buckets) + ["+Inf"], counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+
+    for (name, labels), value in sorted(counters.items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+    for name, (help_text, collect) in sorted(_gauges.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in sorted(collect().items()):
+            lines.append(f"{name}{_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def install(app, exclude_paths=("/metrics",)) -> None:
+    """Add GET /metrics, per-path request latency, and the opt-in X-Timing debug header."""
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_endpoint():
+        return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+    @app.middleware("http")
+    async def timing(request: Request, call_next):
+        if request.url.path in exclude_paths:
+            return await call_next(request)
+        timings = [] if request.headers.get(TIMING_HEADER) else None
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            _request_timings.reset(token)
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        # Label by route template, not raw path, so /index/{job_id} stays one series;
+        # unrouted paths (404 probes) share one label instead of one series per URL
+        observe(REQUEST_METRIC, elapsed, path=getattr(route, "path", UNMATCHED_PATH))
+        if timings is not None:
+            # Streaming bodies finish after the headers go out; only spans done by now are listed
+            response.headers[TIMING_HEADER] = ";".join(
+                f"{stage}={seconds * 1000:.3f}ms" for stage, seconds in timings + [("total", elapsed)])
+        return response
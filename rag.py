@@ -1,66 +1,47 @@
 import os
+from collections import defaultdict
 import numpy as np
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Tuple
 from dotenv import load_dotenv
-from sklearn.metrics.pairwise import cosine_similarity
+from ann import ANN_NPROBE, ExactIndex, sync_ivf
+from embeddings import get_client, text_hash
+from ingest import CSV_FILES
+from langid import canonical, detect_language
+from lexical import BM25Index, reciprocal_rank_fusion
+from vector_store import VectorStore, open_store, write_store
 
 # Load environment variables
 load_dotenv()
 
-# Provider can be "openai" or "gemini"
+# Provider can be "openai", "gemini" or "fake" (offline, deterministic)
 PROVIDER = os.getenv("PROVIDER", "openai").lower()
 OPENAI_EMBED_MODEL = os.getenv("OPENAI_EMBED_MODEL", "text-embedding-3-large")
 GEMINI_EMBED_MODEL = os.getenv("GEMINI_EMBED_MODEL", "models/embedding-001")
 GEMINI_GEN_MODEL = os.getenv("GEMINI_GEN_MODEL", "gemini-1.5-flash")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-_openai_client = None
-_gemini_embed_model = None
 _gemini_gen_model = None
-
-def _get_openai_client():
-    global _openai_client
-    if _openai_client is None:
-        from openai import OpenAI
-        _openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    return _openai_client
-
-def _embed_openai(texts: List[str]) -> np.ndarray:
-    client = _get_openai_client()
-    response = client.embeddings.create(model=OPENAI_EMBED_MODEL, input=texts)
-    embeddings = [data.embedding for data in response.data]
-    return np.array(embeddings, dtype=float)
+_genai = None
 
 def _configure_gemini():
-    import google.generativeai as genai
-    genai.configure(api_key=GEMINI_API_KEY)
-    return genai
-
-def _get_gemini_embed_model():
-    global _gemini_embed_model
-    if _gemini_embed_model is None:
-        genai = _configure_gemini()
-        _gemini_embed_model = GEMINI_EMBED_MODEL  # Model name for embedding
-    return _gemini_embed_model
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=GEMINI_API_KEY)
+        _genai = genai
+    return _genai
 
-def _embed_gemini(texts: List[str]) -> np.ndarray:
-    genai = _configure_gemini()
-    vecs = []
-    model = _get_gemini_embed_model()
-    try:
-        for text in texts:
-            response = genai.embed_content(model=model, content=text, task_type="retrieval_document")
-            vecs.append(response["embedding"])
-        return np.array(vecs, dtype=float)
-    except Exception as e:
-        raise Exception(f"Error generating embeddings with Gemini: {str(e)}")
+def _embed_model_name() -> str:
+    if PROVIDER == "gemini":
+        return GEMINI_EMBED_MODEL
+    if PROVIDER == "fake":
+        return "fake"
+    return OPENAI_EMBED_MODEL
 
 def embed(texts: List[str]) -> np.ndarray:
-    if PROVIDER == "gemini":
-        return _embed_gemini(texts)
-    else:
-        return _embed_openai(texts)
+    # Batched, concurrent, and backed by the on-disk embedding cache
+    return get_client(PROVIDER, _embed_model_name()).embed(texts)
 
 def _get_gemini_gen_model():
     global _gemini_gen_model
@@ -98,52 +79,266 @@ def generate_answer(query: str, contexts: List[Dict]) -> str:
     except Exception as e:
         return f"Error generating answer: {str(e)}"
 
+KNOWLEDGE_STORE = os.getenv("KNOWLEDGE_STORE", "data/knowledge.vec")
+KNOWLEDGE_STORE_DTYPE = os.getenv("KNOWLEDGE_STORE_DTYPE", "float32")  # float32 | float16 | int8
+# Vector search backend: "exact", "ivf", or "auto" (ivf once the store reaches ANN_MIN_ROWS rows)
+KNOWLEDGE_ANN = os.getenv("KNOWLEDGE_ANN", "auto")
+ANN_MIN_ROWS = int(os.getenv("ANN_MIN_ROWS", "50000"))
+MIN_SCORE = 0.5  # Relevance threshold below which results are dropped
+# Lexical fast path: answer from BM25 alone when the best hit covers the query this well
+LEXICAL_CONFIDENCE = float(os.getenv("LEXICAL_CONFIDENCE", "0.8"))
+# Word overlap with a row's question below which a BM25 hit is noise (n-grams of the answer text)
+LEXICAL_MIN_OVERLAP = float(os.getenv("LEXICAL_MIN_OVERLAP", "0.3"))
+FUSION_CANDIDATES = 20  # depth of each ranking fed into reciprocal-rank fusion
+RRF_K = 60
+RESULT_COLUMNS = {"Category": "Category", "Question": "Question", "Answer": "Bot Response",
+                  "Language": "Language", "Source": "Source"}
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
 class CSVKnowledgeBase:
-    def __init__(self, csv_path: str):
-        print(f"[INFO] Loading CSV from: {csv_path}")
-        self.csv_path = csv_path
-        self.df = pd.read_csv(csv_path)
+    def __init__(self, csv_path=None, store_path: str = KNOWLEDGE_STORE, store_dtype: str = KNOWLEDGE_STORE_DTYPE,
+                 ann: str = KNOWLEDGE_ANN, nprobe: int = ANN_NPROBE):
+        # One knowledge base over all dataset CSVs unless told otherwise
+        self.csv_paths = [csv_path] if isinstance(csv_path, str) else list(csv_path or CSV_FILES)
+        frames = []
+        for path in self.csv_paths:
+            if os.path.exists(path):
+                print(f"[INFO] Loading CSV from: {path}")
+                frames.append(pd.read_csv(path).assign(source_file=path))
+        self.store_path = store_path
+        self.store_dtype = store_dtype
+        self.ann_mode = ann
+        self.nprobe = nprobe
+        self._build(pd.concat(frames, ignore_index=True))
+
+    def insert(self, rows, source: str = "insert") -> int:
+        """Add dataset-shaped rows (Category, Question, Bot Response, Language, Source); returns how many were new.
+
+        Only the new rows are embedded, and an IVF index keeps its lists: new rows go to their
+        nearest centroid, with a retrain only once ANN_RETRAIN_FRACTION of the rows are new.
+        """
+        new = pd.DataFrame(rows)
+        if "source_file" not in new:
+            new = new.assign(source_file=source)
+        before = len(self.df)
+        self._build(pd.concat([self.df, new], ignore_index=True))
+        return len(self.df) - before
 
+    def _build(self, df: pd.DataFrame) -> None:
         # Create a combined text field for embedding
-        self.df['retrieval_text'] = self.df[['Category', 'Question', 'Bot Response', 'Language', 'Source']].astype(str).agg(' | '.join, axis=1)
+        df['retrieval_text'] = df[['Category', 'Question', 'Bot Response', 'Language', 'Source']].astype(str).agg(' | '.join, axis=1)
+        # The datasets repeat rows heavily; duplicates would only crowd the top-k
+        df = df.drop_duplicates('retrieval_text', ignore_index=True)
+        # Group rows by language so each language partition is a contiguous (zero-copy) slice
+        df['lang'] = [canonical(str(lang)) or "Other" for lang in df['Language']]
+        df = df.sort_values('lang', kind='stable', ignore_index=True)
+        bounds = df.groupby('lang', sort=False).indices
+        partitions = {lang: slice(int(idx[0]), int(idx[-1]) + 1) for lang, idx in bounds.items()}
+        hashes = [text_hash(t) for t in df['retrieval_text']]
 
-        self.index_path = csv_path.replace(".csv", ".npz")
-        if os.path.exists(self.index_path):
-            print("[INFO] Loading cached embeddings...")
-            data = np.load(self.index_path)
-            self.embeddings = data['embeddings']
+        store = self._load_store(df, hashes)
+        # Unit-length float32 rows, so cosine similarity is a plain dot product.
+        # For float32 stores this is the memmap itself, shared by all workers via the page cache.
+        matrix = store.matrix()
+        # Exact scan for small stores; IVF (persisted next to the store) once it grows
+        if self.ann_mode == "ivf" or (self.ann_mode == "auto" and len(hashes) >= ANN_MIN_ROWS):
+            ann = sync_ivf(f"{self.store_path}.ivf", matrix, hashes, nprobe=self.nprobe)
         else:
-            print("[INFO] Generating new embeddings...")
-            self.embeddings = embed(self.df['retrieval_text'].tolist())
-            np.savez(self.index_path, embeddings=self.embeddings)
+            ann = ExactIndex()
+        # Plain object arrays avoid pandas row access when building results
+        columns = {key: df[col].to_numpy(dtype=object) for key, col in RESULT_COLUMNS.items()}
+        # Lexical index over question + answer; strong on Sheng and code-switched text
+        lexical = BM25Index((df['Question'].astype(str) + " " + df['Bot Response'].astype(str)).tolist())
+
+        # Built aside and swapped in together, so a query during insert() sees one consistent version
+        (self.df, self.partitions, self.hashes, self.store, self.matrix, self.ann, self.columns,
+         self.lexical) = df, partitions, hashes, store, matrix, ann, columns, lexical
+
+    def _load_store(self, df: pd.DataFrame, hashes: List[str]) -> VectorStore:
+        model = f"{PROVIDER}:{_embed_model_name()}"
+        store = open_store(self.store_path)
+        if (store is not None and store.model == model and store.dtype == self.store_dtype
+                and store.hashes == hashes):
+            print("[INFO] Loading cached embeddings...")
+            return store
+
+        # Reuse whatever rows the old store already has for this model; embed only the rest
+        known = store.vectors_for(hashes) if store is not None and store.model == model else {}
+        missing = [i for i, h in enumerate(hashes) if h not in known]
+        print(f"[INFO] Generating embeddings for {len(missing)} of {len(hashes)} rows...")
+        fresh = embed(df['retrieval_text'].iloc[missing].tolist()) if missing else []
+        for i, vec in zip(missing, fresh):
+            known[hashes[i]] = vec
+        vectors = np.stack([known[h] for h in hashes])
+        write_store(self.store_path, vectors, hashes, model, dtype=self.store_dtype,
+                    extra={"sources": df['source_file'].tolist()})
+        return VectorStore(self.store_path)
+
+    def _row(self, i: int, score: float, **extra) -> Dict:
+        result = {"score": score}
+        for key, values in self.columns.items():
+            result[key] = values[i]
+        result.update(extra)
+        return result
+
+    def _results(self, indices: np.ndarray, scores: np.ndarray) -> List[Dict]:
+        results = []
+        for i, score in zip(indices, scores):
+            if score <= MIN_SCORE:
+                break  # hits are sorted by score, nothing after this passes
+            results.append(self._row(int(i), float(score)))
+        return results
+
+    def _search(self, queries: np.ndarray, top_k: int, rows: slice = None):
+        """Best (row ids, cosine scores) per unit-length query, from the exact or ANN backend."""
+        return self.ann.search(self.matrix, queries, top_k, rows=rows)
+
+    def query_vector(self, query_vec: np.ndarray, top_k: int = 5) -> List[Dict]:
+        q = _normalize_rows(np.asarray(query_vec).reshape(1, -1))
+        return self._results(*self._search(q, top_k)[0])
+
+    def query_many(self, query_vecs: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+        # One (batch x dim) @ (dim x rows) multiply for the whole batch on the exact backend
+        q = _normalize_rows(np.atleast_2d(query_vecs))
+        if q.shape[0] == 0:
+            return []
+        return [self._results(*hits) for hits in self._search(q, top_k)]
+
+    def partition(self, language: str = None) -> slice:
+        """Rows to search for `language`; every row when it is unknown or has no partition."""
+        return self.partitions.get(canonical(language), slice(0, len(self.df)))
+
+    def lexical_search(self, query_text: str, top_k: int = 5,
+                       rows: slice = None) -> Tuple[List[Tuple[int, float]], float]:
+        """BM25 hits plus how confident we are the best hit is the question asked (0..1)."""
+        hits = self.lexical.search(query_text, top_k, rows=rows)
+        if not hits:
+            return hits, 0.0
+        return hits, self.lexical.overlap(query_text, self.columns["Question"][hits[0][0]])
+
+    def query(self, query_text: str, top_k: int = 5, mode: str = "hybrid", language: str = None) -> List[Dict]:
+        """mode: "hybrid" (BM25 + vectors, RRF-fused), "dense" or "lexical".
+
+        language: search only that language's partition ("auto" to detect it
+        from the query); None searches everything.
+
+        "score" is always the cosine similarity to the query, or None for
+        lexical results (the query is never embedded). Lexical and hybrid rows
+        also carry "overlap", the query/question word overlap (0..1).
+        """
+        if language == "auto":
+            language, _ = detect_language(query_text)
+        rows = self.partition(language)
+        results = self._query_rows(query_text, top_k, mode, rows)
+        if not results and rows.stop - rows.start < len(self.df):
+            # Nothing relevant on-language; fall back to all partitions
+            results = self._query_rows(query_text, top_k, mode, slice(0, len(self.df)))
+        return results
 
-    def query(self, query_text: str, top_k: int = 5) -> List[Dict]:
-        query_vec = embed([query_text])
-        similarities = cosine_similarity(query_vec, self.embeddings)[0]
-        top_indices = similarities.argsort()[::-1][:top_k]
+    def query_batch(self, query_texts: List[str], top_k: int = 5, mode: str = "hybrid",
+                    language: str = None) -> List[List[Dict]]:
+        """query() for many texts at once, results in input order.
 
+        Every query that needs a vector goes out in one embed() call, and each
+        language partition is scored with one (batch x dim) @ (dim x rows) multiply.
+        """
+        n = len(query_texts)
+        languages = [detect_language(t)[0] for t in query_texts] if language == "auto" else [language] * n
+        everything = slice(0, len(self.df))
+        results: List[List[Dict]] = [None] * n
+        hits: List[List[Tuple[int, float]]] = [None] * n
+        pending = []
+        for b, text in enumerate(query_texts):
+            if mode != "dense":
+                found, confidence = self.lexical_search(text, max(top_k, FUSION_CANDIDATES), rows=self.partition(languages[b]))
+                if mode == "lexical" or (found and confidence >= LEXICAL_CONFIDENCE):
+                    results[b] = self._lexical_results(text, found, top_k)
+                    continue
+                hits[b] = found
+            pending.append(b)
+
+        vectors = {}
+        if pending:
+            vectors = dict(zip(pending, _normalize_rows(embed([query_texts[b] for b in pending]))))
+            groups = defaultdict(list)
+            for b in pending:
+                rows = self.partition(languages[b])
+                groups[(rows.start, rows.stop)].append(b)
+            depth = top_k if mode == "dense" else FUSION_CANDIDATES
+            for (start, stop), group in groups.items():
+                found = self._search(np.stack([vectors[b] for b in group]), depth, rows=slice(start, stop))
+                for b, (ids, scores) in zip(group, found):
+                    results[b] = self._dense_results(query_texts[b], vectors[b], ids, scores, top_k, mode, hits[b])
+
+        for b in range(n):
+            if not results[b] and self.partition(languages[b]) != everything:
+                # Nothing relevant on-language; fall back to all partitions
+                results[b] = self._query_rows(query_texts[b], top_k, mode, everything, q=vectors.get(b))
+        return results
+
+    def _overlap(self, query_text: str, i: int) -> float:
+        return self.lexical.overlap(query_text, self.columns["Question"][i])
+
+    def _lexical_results(self, query_text: str, hits: List[Tuple[int, float]], top_k: int) -> List[Dict]:
         results = []
-        for i in top_indices:
-            if similarities[i] > 0.5:  # Add a relevance threshold to filter
-                results.append({
-                    "score": float(similarities[i]),
-                    "Category": self.df.iloc[i]["Category"],
-                    "Question": self.df.iloc[i]["Question"],
-                    "Answer": self.df.iloc[i]["Bot Response"],
-                    "Language": self.df.iloc[i]["Language"],
-                    "Source": self.df.iloc[i]["Source"],
-                })
+        for i, score in hits:
+            overlap = self._overlap(query_text, i)
+            if overlap >= LEXICAL_MIN_OVERLAP:
+                results.append(self._row(i, None, retriever="lexical", bm25=score, overlap=overlap))
+                if len(results) == top_k:
+                    break
         return results
 
+    def _dense_results(self, query_text: str, q: np.ndarray, ids: np.ndarray, scores: np.ndarray, top_k: int,
+                       mode: str, hits: List[Tuple[int, float]]) -> List[Dict]:
+        if mode == "dense":
+            return self._results(ids[:top_k], scores[:top_k])
+        dense_ranking = [int(i) for i, score in zip(ids, scores) if score > MIN_SCORE]
+        lexical_ranking = [i for i, _ in hits]
+        fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=RRF_K)
+        # "score" stays the cosine similarity; the order comes from the fused rank.
+        # Lexical-only hits were not among the dense candidates, so score those rows directly.
+        dense = dict(zip(ids.tolist(), scores.tolist()))
+        results = []
+        for i, rrf in fused:
+            score = dense[i] if i in dense else float(self.matrix[i] @ q)
+            overlap = self._overlap(query_text, i)
+            # Relevant to either retriever: close in embedding space, or shares the question's words
+            if score > MIN_SCORE or overlap >= LEXICAL_MIN_OVERLAP:
+                results.append(self._row(i, score, retriever="hybrid", rrf=rrf, overlap=overlap))
+                if len(results) == top_k:
+                    break
+        return results
+
+    def _query_rows(self, query_text: str, top_k: int, mode: str, rows: slice, q: np.ndarray = None) -> List[Dict]:
+        hits = None
+        if mode != "dense":
+            hits, confidence = self.lexical_search(query_text, max(top_k, FUSION_CANDIDATES), rows=rows)
+            if mode == "lexical" or (hits and confidence >= LEXICAL_CONFIDENCE):
+                # Near-verbatim dataset question: skip the embedding call entirely
+                return self._lexical_results(query_text, hits, top_k)
+
+        if q is None:
+            q = _normalize_rows(np.asarray(embed([query_text])[0]).reshape(1, -1))[0]
+        ids, scores = self._search(q[None], top_k if mode == "dense" else FUSION_CANDIDATES, rows=rows)[0]
+        return self._dense_results(query_text, q, ids, scores, top_k, mode, hits)
+
 # Run this file directly for testing
 if __name__ == "__main__":
-    kb = CSVKnowledgeBase("data/knowledge.csv")
+    kb = CSVKnowledgeBase()
 
     while True:
         query = input("\nAsk a question (or type 'exit'): ")
         if query.lower() == "exit":
             break
-        contexts = kb.query(query)
+        contexts = kb.query(query, language="auto")
         if contexts:
             answer = generate_answer(query, contexts)
             print("\nAnswer:")
@@ -0,0 +1,141 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "100"))
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "./ratelimit.sqlite3")
+# Only honour X-Forwarded-For when running behind a proxy we control
+RATE_LIMIT_TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() in ("1", "true", "yes")
+# Trusted proxies in front of the app; each appends one X-Forwarded-For entry
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", "1"))
+EVICT_EVERY = 1000  # requests between sweeps of idle keys
+
+
+class MemoryBackend:
+    """Per-process token buckets; fine for a single worker."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, rate: float, now: float, cost: float = 1.0) -> Tuple[bool, float]:
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            return allowed, tokens
+
+    def evict(self, before: float) -> None:
+        with self._lock:
+            for key in [k for k, (_, updated) in self._buckets.items() if updated < before]:
+                del self._buckets[key]
+
+
+class SQLiteBackend:
+    """Token buckets in a local SQLite file, shared by every uvicorn worker on the host."""
+
+    def __init__(self, path: str = RATE_LIMIT_DB):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float, now: float, cost: float = 1.0) -> Tuple[bool, float]:
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError as e:
+            # Lock timeout under contention: let the request through rather than fail it
+            print(f"[WARN] Rate limit store busy, not limiting {key}: {e}")
+            return True, capacity
+        try:
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)", (key, tokens, now))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def evict(self, before: float) -> None:
+        try:
+            self._conn().execute("DELETE FROM buckets WHERE updated < ?", (before,))
+        except sqlite3.OperationalError as e:
+            print(f"[WARN] Skipped rate limit eviction: {e}")
+
+
+class RateLimiter:
+    """Token bucket per key: `per_minute` burst, refilled continuously at per_minute/60 per second."""
+
+    def __init__(self, per_minute: int = RATE_LIMIT_PER_MINUTE, backend=None):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.backend = backend or SQLiteBackend()
+        # A key idle this long has a full bucket again, so dropping it changes nothing
+        self.idle_seconds = self.capacity / self.rate if self.rate else 60.0
+        self._calls = 0
+
+    def hit(self, key: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Consume `cost` tokens, all or none; returns (allowed, seconds until that many are available)."""
+        now = time.time()
+        allowed, tokens = self.backend.take(key, self.capacity, self.rate, now, cost)
+        self._calls += 1
+        if self._calls % EVICT_EVERY == 0:
+            self.backend.evict(now - self.idle_seconds)
+        retry_after = 0.0 if allowed else (cost - tokens) / self.rate
+        return allowed, retry_after
+
+
+def client_key(request: Request) -> str:
+    if RATE_LIMIT_TRUST_PROXY:
+        # Entries left of the ones our proxies appended are whatever the client sent; the
+        # entry added by the outermost trusted proxy is the first one we can believe
+        hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+        if RATE_LIMIT_PROXY_HOPS > 0 and len(hops) >= RATE_LIMIT_PROXY_HOPS:
+            return hops[-RATE_LIMIT_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def install(app, limiter: Optional[RateLimiter] = None, exempt_paths=("/health",),
+            key_func: Callable[[Request], str] = client_key) -> RateLimiter:
+    limiter = limiter or RateLimiter()
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        if request.url.path in exempt_paths:
+            return await call_next(request)
+        # SQLite may wait briefly on the write lock; keep that off the event loop
+        allowed, retry_after = await run_in_threadpool(limiter.hit, key_func(request))
+        if not allowed:
+            return JSONResponse(status_code=429, content={"detail": "Too many requests"},
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+        return await call_next(request)
+
+    return limiter
@@ -2,4 +2,5 @@
 set -euo pipefail
 export $(grep -v '^#' .env | xargs -d '\n' -r)
 export APP_HOST=${APP_HOST:-0.0.0.0}
+# Startup is fast now (models warm up in the background), so --reload is cheap; poll /ready for readiness
 uvicorn main:app --host $APP_HOST --port ${APP_PORT:-8000} --reload
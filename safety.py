@@ -1,8 +1,16 @@
-from typing import Dict, Tuple, Optional
+import re
+from typing import Dict, Tuple, Optional, NamedTuple
 
+from audit import audit_log
+
+# Matched as whole words, so inflections are listed explicitly. "help" and "hurt"
+# deliberately stay bare: "helpful" and "it hurts" are not emergencies.
 EMERGENCY_KEYWORDS = {
-    "english": ["help", "unsafe", "in danger", "stalking", "stalker", "rape", "assault", "violence",
-                "domestic", "abuse", "harassment", "sos", "panic", "kidnap", "threat", "blackmail",
+    "english": ["help", "unsafe", "in danger", "stalking", "stalker", "stalked", "stalks",
+                "rape", "raped", "raping", "rapist", "assault", "assaulted", "assaulting",
+                "violence", "violent", "domestic", "abuse", "abused", "abusing", "abusive", "abuser",
+                "harassment", "harassed", "harassing", "sos", "panic", "kidnap", "kidnapped", "kidnapping",
+                "threat", "threats", "threatened", "threatening", "blackmail", "blackmailed", "blackmailing",
                 "emergency", "attacked", "hurt"],
     "swahili": ["msaada", "hatari", "niko hatarini", "ninahitaji msaada", "ubakaji", "unanyanyaswa",
                 "kudhulumiwa", "kupigwa", "unyanyasaji", "tishio", "hatari ya maisha", "misheni"],
@@ -10,35 +18,160 @@ EMERGENCY_KEYWORDS = {
               "niko tight", "wamenishika", "shida kubwa"]
 }
 
-def detect_emergency(text: str) -> bool:
+class KeywordMatch(NamedTuple):
+    group: str      # language group or rule name the keyword belongs to
+    keyword: str
+    start: int
+    end: int
+
+
+class KeywordMatcher:
+    """All keywords compiled into one word-bounded, case-insensitive regex.
+
+    One pass over the text finds the first hit; longer phrases win over
+    their prefixes ("niko hatarini" before "hatari").
+    """
+
+    def __init__(self, groups: Dict[str, list]):
+        self._group_of = {}
+        for group, keywords in groups.items():
+            for kw in keywords:
+                self._group_of.setdefault(self._key(kw), group)
+        alternatives = sorted(self._group_of, key=len, reverse=True)
+        body = "|".join(r"\s+".join(map(re.escape, kw.split())) for kw in alternatives)
+        self.pattern = re.compile(rf"(?<!\w)(?:{body})(?!\w)", re.IGNORECASE)
+        self.max_len = max(len(kw) for kw in alternatives)
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return " ".join(text.lower().split())
+
+    def _to_match(self, m: "re.Match", offset: int = 0) -> KeywordMatch:
+        keyword = self._key(m.group(0))
+        return KeywordMatch(self._group_of[keyword], keyword, m.start() + offset, m.end() + offset)
+
+    def search(self, text: str) -> Optional[KeywordMatch]:
+        m = self.pattern.search(text)
+        return self._to_match(m) if m else None
+
+    def finditer(self, text: str):
+        for m in self.pattern.finditer(text):
+            yield self._to_match(m)
+
+    def scanner(self) -> "StreamScanner":
+        return StreamScanner(self)
+
+
+class StreamScanner:
+    """Incremental matcher for text that arrives in chunks (e.g. streamed LLM tokens).
+
+    feed() returns the part of the stream that is safe to emit. The last few
+    characters are held back because a keyword may straddle two chunks; once a
+    keyword is found, `match` is set and nothing more is released.
+    """
+
+    def __init__(self, matcher: KeywordMatcher):
+        self.matcher = matcher
+        self.match: Optional[KeywordMatch] = None
+        # Enough to hold any keyword plus the character before it for the boundary check
+        self._hold = 2 * matcher.max_len + 1
+        self._buffer = ""
+        self._offset = 0  # stream position of _buffer[0]
+        self._scanned = 0  # leading characters of _buffer already released; kept only as left context
+
+    def _scan(self, final: bool) -> None:
+        for m in self.matcher.pattern.finditer(self._buffer, self._scanned):
+            # A hit that touches the end of the buffer may continue in the next chunk
+            # ("hurt" + "s"), so it only counts once more text or the end of stream arrives
+            if final or m.end() < len(self._buffer):
+                self.match = self.matcher._to_match(m, self._offset)
+            return
+
+    def feed(self, chunk: str) -> str:
+        if self.match is not None:
+            return ""
+        self._buffer += chunk
+        self._scan(final=False)
+        if self.match is not None:
+            return ""
+        release = len(self._buffer) - self._hold
+        if release <= self._scanned:
+            return ""
+        out = self._buffer[self._scanned:release]
+        # Keep the last released character as left context for the word boundary
+        self._buffer = self._buffer[release - 1:]
+        self._offset += release - 1
+        self._scanned = 1
+        return out
+
+    def finish(self) -> str:
+        if self.match is not None:
+            return ""
+        self._scan(final=True)
+        if self.match is not None:
+            return ""
+        out = self._buffer[self._scanned:]
+        self._buffer = ""
+        self._scanned = 0
+        return out
+
+
+EMERGENCY_MATCHER = KeywordMatcher(EMERGENCY_KEYWORDS)
+# Keyword language group -> emergency_response() key
+EMERGENCY_RESPONSE_KEYS = {"english": "en", "swahili": "sw", "sheng": "sheng"}
+
+def find_emergency(text: str) -> Optional[KeywordMatch]:
     if not text or not isinstance(text, str):
-        return False
-    t = text.lower().strip()
-    for lang_keywords in EMERGENCY_KEYWORDS.values():
-        for kw in lang_keywords:
-            if kw in t:
-                return True
-    return False
+        return None
+    return EMERGENCY_MATCHER.search(text)
+
+def detect_emergency(text: str) -> bool:
+    return find_emergency(text) is not None
+
+# Closing line of the emergency text. With the audit log on, conversations are kept
+# (redacted, best effort) for safety review, so users are not told nothing is stored.
+PRIVACY_NOTICES = {
+    "en": "This chat is anonymous; no data is stored.",
+    "sw": "Mazungumzo haya ni ya siri; hakuna taarifa inayohifadhiwa.",
+    "sheng": "Hii chat ni anonymous; hatu-hifadhi details zako.",
+}
+AUDITED_PRIVACY_NOTICES = {
+    "en": ("This chat is anonymous; messages are kept for safety review, "
+           "with phone numbers and locations removed where we can."),
+    "sw": ("Mazungumzo haya ni ya siri; ujumbe huhifadhiwa kwa ukaguzi wa usalama, "
+           "na tunaondoa nambari za simu na maeneo tunapoweza."),
+    "sheng": "Hii chat ni anonymous; messages zinawekwa kwa safety review, tunatoa namba na location tukiweza.",
+}
 
 def emergency_response() -> Dict[str, str]:
+    notices = AUDITED_PRIVACY_NOTICES if audit_log.enabled else PRIVACY_NOTICES
     return {
         "en": ("If you are in immediate danger, call **999** (Kenya Police) now. "
                "You can also reach the **GBV Toll‑Free Helpline 1195**. "
-               "If safe, share your location with a trusted person. "
-               "This chat is anonymous; no data is stored."),
+               "If safe, share your location with a trusted person. " + notices["en"]),
         "sw": ("Ukiwa kwenye hatari sasa, pigia **999** (Polisi wa Kenya) mara moja. "
                "Pia unaweza kupiga **1195** – Huduma ya GBV bila malipo. "
-               "Ikiwa ni salama, shiriki eneo lako na mtu unayemuamini. "
-               "Mazungumzo haya ni ya siri; hakuna taarifa inayohifadhiwa."),
+               "Ikiwa ni salama, shiriki eneo lako na mtu unayemuamini. " + notices["sw"]),
         "sheng": ("Kama ni urgent, pigia **999** saa hii. Pia kuna **1195** ya GBV – free. "
-                  "Kama ni poa, tuma location kwa mtu wako wa kuamini. "
-                  "Hii chat ni anonymous; hatu-hifadhi details zako.")
+                  "Kama ni poa, tuma location kwa mtu wako wa kuamini. " + notices["sheng"])
     }
 
+# One line put ahead of curated answers to questions that also trip an emergency keyword,
+# so hotlines still come first (SAFETY_BY_DESIGN) without replacing the vetted answer
+HOTLINE_REMINDERS = {
+    "en": "If you are in danger, call 999 or the GBV helpline 1195.",
+    "sw": "Ukiwa hatarini, pigia 999 au 1195.",
+    "sheng": "Kama uko kwa danger, pigia 999 ama 1195.",
+}
+
+def with_hotlines(answer: str, lang_key: str) -> str:
+    return f"{HOTLINE_REMINDERS.get(lang_key, HOTLINE_REMINDERS['en'])} {answer}"
+
 SAFETY_BY_DESIGN = """
 - No storage of personal identifiers by default.
 - Anonymous mode; logs redact names, phones, GPS.
-- Escalation: emergency keyword detection → show hotlines first before any other reply.
+- Escalation: emergency keyword detection → show hotlines first before any other reply
+  (a matching curated FAQ answer follows a one-line hotline reminder).
 - Dignity & privacy: trauma‑informed language, non‑judgmental tone.
 - Inclusivity: support English, Swahili, and Sheng.
 - Content moderation: Block harmful or explicit responses.
@@ -46,10 +179,26 @@ SAFETY_BY_DESIGN = """
 - Audit trail: Log interactions (anonymized) for safety review.
 """
 
+UNSAFE_RESPONSE_KEYWORDS = {
+    "harmful": ["kill", "kills", "killed", "killing", "killer", "hurt", "hurting", "violence", "violent",
+                "explicit", "explicitly", "illegal", "illegally"],
+    "personal_data": ["personal data", "location", "locations"],
+}
+UNSAFE_RESPONSE_MESSAGES = {
+    "harmful": "Response contains potentially harmful content.",
+    "personal_data": "Response inadvertently shares personal data.",
+}
+UNSAFE_RESPONSE_MATCHER = KeywordMatcher(UNSAFE_RESPONSE_KEYWORDS)
+
+def response_scanner() -> StreamScanner:
+    return UNSAFE_RESPONSE_MATCHER.scanner()
+
 def validate_safety_response(response: str) -> Tuple[bool, Optional[str]]:
-    unsafe_keywords = ["kill", "hurt", "violence", "explicit", "illegal"]
-    if any(kw in response.lower() for kw in unsafe_keywords):
-        return False, "Response contains potentially harmful content."
-    if "personal data" in response.lower() or "location" in response.lower():
-        return False, "Response inadvertently shares personal data."
-    return True, None
\ No newline at end of file
+    found = None
+    for match in UNSAFE_RESPONSE_MATCHER.finditer(response):
+        found = match.group
+        if found == "harmful":
+            break
+    if found:
+        return False, UNSAFE_RESPONSE_MESSAGES[found]
+    return True, None
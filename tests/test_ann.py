@@ -0,0 +1,70 @@
+import os
+
+import numpy as np
+import pytest
+
+import rag
+from ann import ExactIndex, IVFIndex, clustered_vectors, noisy_queries, sync_ivf
+from embeddings import get_client
+
+
+@pytest.fixture(scope="module")
+def data():
+    return clustered_vectors(4000, 32, clusters=64)
+
+
+def _recall(found, truth):
+    return np.mean([len(set(f[0].tolist()) & set(t[0].tolist())) / len(t[0]) for f, t in zip(found, truth)])
+
+
+def test_ivf_recall_against_exact(data):
+    queries = noisy_queries(data, 50)
+    index = IVFIndex.train(data, nprobe=8)
+    truth = ExactIndex().search(data, queries, 10)
+    assert _recall(index.search(data, queries, 10), truth) > 0.9
+    # Probing every list is the exact scan
+    assert _recall(index.search(data, queries, 10, nprobe=len(index.centroids)), truth) == 1.0
+
+
+def test_ivf_search_respects_row_range(data):
+    index = IVFIndex.train(data)
+    ids, _ = index.search(data, data[:1], 5, rows=slice(1000, 2000), nprobe=len(index.centroids))[0]
+    assert len(ids) == 5 and ((ids >= 1000) & (ids < 2000)).all()
+
+
+def test_sync_ivf_reuses_lists_for_surviving_rows(tmp_path, data):
+    path = str(tmp_path / "kb.vec.ivf")
+    hashes = [f"h{i}" for i in range(len(data))]
+    first = sync_ivf(path, data[:3500], hashes[:3500])
+    # 500 new rows, in a different order: old rows keep their list, new ones are assigned
+    order = np.random.default_rng(0).permutation(len(data))
+    grown = sync_ivf(path, data[order], [hashes[i] for i in order])
+    np.testing.assert_array_equal(grown.centroids, first.centroids)
+    old = order < 3500
+    np.testing.assert_array_equal(grown.labels[old], first.labels[order[old]])
+    loaded, saved = IVFIndex.load(path)
+    assert saved == [hashes[i] for i in order]
+    np.testing.assert_array_equal(loaded.labels, grown.labels)
+
+
+def test_knowledge_base_insert(tmp_path, monkeypatch):
+    monkeypatch.setattr(rag, "PROVIDER", "fake")
+    client = get_client("fake", "fake", use_cache=False)
+    calls = []
+    monkeypatch.setattr(rag, "embed", lambda texts: calls.append(len(texts)) or client.embed(texts))
+    csv = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "knowledge.csv")
+    kb = rag.CSVKnowledgeBase(csv, store_path=str(tmp_path / "kb.vec"), ann="ivf")
+    rows = len(kb.df)
+    labels = dict(zip(kb.hashes, kb.ann.labels.tolist()))
+
+    added = kb.insert([{"Category": "Legal", "Question": "How do I get a protection order?",
+                        "Bot Response": "Apply at the nearest magistrate's court.", "Language": "Kiswahili",
+                        "Source": "Partner"}])
+    assert added == 1 and len(kb.df) == rows + 1
+    assert calls[-1] == 1  # only the new row was embedded
+    # Existing rows keep their IVF lists
+    assert all(labels[h] == label for h, label in zip(kb.hashes, kb.ann.labels.tolist()) if h in labels)
+    assert kb.query("How do I get a protection order?", mode="lexical")[0]["Source"] == "Partner"
+    assert kb.insert([{"Category": "Legal", "Question": "How do I get a protection order?",
+                       "Bot Response": "Apply at the nearest magistrate's court.", "Language": "Kiswahili",
+                       "Source": "Partner"}]) == 0
@@ -0,0 +1,54 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from audit import AuditLog, redact
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Call me on 0712 345 678 or +254 722-123-456", "Call me on [phone] or [phone]"),
+    ("Befrienders: 0722 178 177", "Befrienders: 0722 178 177"),
+    ("I'm at -1.2921, 36.8219 near town", "I'm at [location] near town"),
+    ("email jane.doe@gmail.com", "email [email]"),
+    ("My name is amina hassan and I need help", "My name is [name] and I need help"),
+    ("I am Jane, he beats me", "I am [name], he beats me"),
+    ("I'm Jane", "I'm [name]"),
+    ("Mimi ni Wanjiru", "Mimi ni [name]"),
+    ("Ni mimi Jane", "Ni mimi [name]"),
+    ("naitwa akinyi, nisaidie", "naitwa [name], nisaidie"),
+    ("Dr. Mwangi Kariuki said", "Dr. [name] said"),
+])
+def test_redact(text, expected):
+    assert redact(text) == expected
+
+
+@pytest.mark.parametrize("text", ["I am scared of my husband", "call me on Monday", "helpline 1195 or 999"])
+def test_redact_leaves_plain_text(text):
+    assert redact(text) == text
+
+
+def test_audit_log_writes_redacted_events(tmp_path):
+    log = AuditLog(str(tmp_path), flush_seconds=0.05)
+    assert log.log("query", query="I am Jane, 0712345678", answer="ok")
+    log.close()
+    files = os.listdir(tmp_path)
+    assert len(files) == 1
+    with gzip.open(tmp_path / files[0]) as f:
+        event = json.loads(f.readline())
+    assert event["event"] == "query" and event["query"] == "I am [name], [phone]"
+
+
+def test_audit_log_drops_when_full(tmp_path):
+    log = AuditLog(str(tmp_path), queue_size=1)
+    log._thread = object()  # no writer: the queue never drains
+    assert log.log("query", query="a")
+    assert not log.log("query", query="b")
+    assert log.stats()["dropped"] == 1
+
+
+def test_audit_log_disabled(tmp_path):
+    log = AuditLog(str(tmp_path), enabled=False)
+    assert not log.log("query", query="a")
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,54 @@
+import time
+
+from cache import SemanticCache
+
+
+def test_exact_hit_after_normalization():
+    cache = SemanticCache(max_entries=10)
+    cache.put("Where can I get help?", "answer", lang="en")
+    assert cache.get("where can i get help", lang="en") == ("answer", None)
+    assert cache.get("where can i get help", lang="sw") == (None, None)
+
+
+def test_semantic_hit_reuses_embedding():
+    cache = SemanticCache(max_entries=10, similarity_threshold=0.9)
+    cache.put("how do I report harassment", "answer", lang="en", embedding=[1.0, 0.0])
+    value, embedding = cache.get("reporting harassment", lang="en", embed_fn=lambda: [0.99, 0.05])
+    assert value == "answer" and embedding == [0.99, 0.05]
+    assert cache.get("something else", lang="en", embed_fn=lambda: [0.0, 1.0])[0] is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_max_entries_bounds_all_partitions():
+    cache = SemanticCache(max_entries=2)
+    for i in range(1000):
+        cache.put("same question", i, lang=f"lang{i}")
+    assert cache.stats()["size"] == 2
+    assert len(cache._partitions) == 2
+    assert cache.get("same question", lang="lang999")[0] == 999
+    assert cache.get("same question", lang="lang0")[0] is None
+
+
+def test_eviction_is_least_recently_used_across_partitions():
+    cache = SemanticCache(max_entries=2)
+    cache.put("a", 1, lang="en")
+    cache.put("b", 2, lang="sw")
+    assert cache.get("a", lang="en")[0] == 1
+    cache.put("c", 3, lang="sheng")
+    assert cache.get("b", lang="sw")[0] is None
+    assert cache.get("a", lang="en")[0] == 1
+
+
+def test_misses_do_not_create_partitions():
+    cache = SemanticCache(max_entries=2)
+    for i in range(100):
+        cache.get("q", lang=f"lang{i}", embed_fn=lambda: [1.0, 0.0])
+    assert cache._partitions == {}
+
+
+def test_ttl_expiry():
+    cache = SemanticCache(max_entries=10, ttl_seconds=0.0001)
+    cache.put("q", "answer", lang="en")
+    time.sleep(0.01)
+    assert cache.get("q", lang="en")[0] is None
+    assert cache.stats()["size"] == 0
@@ -0,0 +1,65 @@
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import embeddings
+from embeddings import EmbeddingCache, EmbeddingClient, FakeProvider
+
+
+def test_embed_batches_and_dedupes():
+    provider = FakeProvider(dim=8, max_batch_size=3)
+    client = EmbeddingClient(provider)
+    texts = [f"text {i}" for i in range(7)] + ["text 0"]
+    vectors = client.embed(texts)
+    assert vectors.shape == (8, 8)
+    assert provider.calls == 3  # 7 unique texts in batches of 3
+    np.testing.assert_array_equal(vectors[0], vectors[7])
+    np.testing.assert_array_equal(vectors[4], provider.vector("text 4"))
+
+
+def test_cache_skips_known_texts(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embed.sqlite3"))
+    provider = FakeProvider(dim=8)
+    first = EmbeddingClient(provider, cache=cache).embed(["a", "b"])
+    assert provider.calls == 1
+    # A second client over the same file embeds only the new text
+    second = EmbeddingClient(provider, cache=EmbeddingCache(cache.path)).embed(["b", "a", "c"])
+    assert provider.calls == 2
+    np.testing.assert_array_equal(second[:2], first[::-1])
+
+
+def test_retries_then_gives_up():
+    class Flaky(FakeProvider):
+        def __init__(self, failures):
+            super().__init__(dim=4)
+            self.failures = failures
+
+        def embed_batch(self, texts):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("reset")
+            return super().embed_batch(texts)
+
+    assert EmbeddingClient(Flaky(2), max_retries=2, backoff=0).embed(["x"]).shape == (1, 4)
+    with pytest.raises(Exception, match="fake"):
+        EmbeddingClient(Flaky(3), max_retries=2, backoff=0).embed(["x"])
+
+
+def test_empty_input():
+    assert EmbeddingClient(FakeProvider(dim=4)).embed([]).shape == (0, 0)
+
+
+def test_gemini_provider_uses_the_given_key(monkeypatch):
+    configured = []
+    genai = types.SimpleNamespace(configure=lambda api_key: configured.append(api_key))
+    monkeypatch.setitem(sys.modules, "google.generativeai", genai)
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    embeddings.GeminiProvider("models/embedding-001", api_key="from-constructor")
+    embeddings.GeminiProvider("models/embedding-001")
+    # No key anywhere: the existing configuration is left alone rather than reset to None
+    assert configured == ["from-constructor"]
+    client = embeddings.get_client("gemini", "models/test-key", use_cache=False, api_key="k2")
+    assert configured[-1] == "k2"
+    assert embeddings.get_client("gemini", "models/test-key", use_cache=False, api_key="k2") is client
@@ -0,0 +1,30 @@
+from faq import FAQIndex, FAQMatch, similarity
+
+ENTRIES = [
+    FAQMatch("How do I report domestic violence?", "Report to the police or call 1195.", "English", "GBV", "Police", 0.0),
+    FAQMatch("How can I calm down after a panic attack?", "Breathe slowly.", "English", "Mental Health", "WHO", 0.0),
+    FAQMatch("Niko kwa hatari, saidia", "Pigia 999.", "Kiswahili", "Emergency SOS", "Helpline", 0.0),
+]
+
+
+def test_exact_match_ignores_case_and_punctuation():
+    found = FAQIndex(ENTRIES).match("how do i report DOMESTIC violence")
+    assert found.answer == ENTRIES[0].answer and found.score == 1.0
+
+
+def test_fuzzy_match_within_threshold():
+    found = FAQIndex(ENTRIES).match("How can I calm down after a panick attack")
+    assert found.question == ENTRIES[1].question and 0.9 <= found.score < 1.0
+
+
+def test_no_match_for_other_questions():
+    faq = FAQIndex(ENTRIES)
+    assert faq.match("How do I report a stolen phone?") is None
+    assert faq.match("Breathe slowly.") is None
+    assert faq.match("") is None
+
+
+def test_similarity():
+    assert similarity("abc", "abc") == 1.0
+    assert similarity("abc", "") == 0.0
+    assert similarity("kitten", "sitting") == 1 - 3 / 7
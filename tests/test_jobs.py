@@ -0,0 +1,73 @@
+import os
+
+from jobs import IngestionQueue, JobStore
+
+
+class FakeIndex:
+    def __init__(self, fail_first=False):
+        self.nodes = []
+        self.fail_first = fail_first
+
+    def insert_nodes(self, nodes):
+        if self.fail_first:
+            self.fail_first = False
+            raise RuntimeError("upstream down")
+        self.nodes.extend(nodes)
+
+
+def _wait(queue, job):
+    # Lets the running job finish, spool cleanup included
+    queue._pool.shutdown(wait=True)
+    return queue.status(job.id)
+
+
+def _upload(tmp_path, index, paragraphs=1, **kwargs):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    done = []
+    queue = IngestionQueue(index, spool_root=str(tmp_path / "spool"), workers=1, batch_size=1,
+                           on_done=done.append, store=store, **kwargs)
+    job = queue.create(language="sw")
+    for n in range(paragraphs):
+        with open(os.path.join(job.spool_dir, f"doc{n}.txt"), "w") as f:
+            f.write("Kama uko hatarini, pigia 1195. " * 400)
+        job.files += 1
+    queue.submit(job)
+    return queue, job, done
+
+
+def test_job_indexes_and_reports_progress(tmp_path):
+    index = FakeIndex()
+    queue, job, done = _upload(tmp_path, index, paragraphs=2)
+    status = _wait(queue, job)
+    assert status["status"] == "done" and status["files"] == 2
+    assert status["nodes_done"] == status["nodes_total"] == len(index.nodes) > 0
+    assert {n.metadata["language"] for n in index.nodes} == {"Kiswahili"}
+    assert done == [job]
+    assert not os.path.exists(job.spool_dir)
+
+
+def test_status_and_index_stamp_are_shared_through_the_store(tmp_path):
+    other = IngestionQueue(FakeIndex(), spool_root=str(tmp_path / "spool"), workers=1,
+                           store=JobStore(str(tmp_path / "jobs.sqlite3")))
+    assert other.index_changed(check_seconds=0) is False
+    queue, job, _ = _upload(tmp_path, FakeIndex())
+    _wait(queue, job)
+    # A second worker sees the job it never ran, and learns that answers may be stale
+    assert other.get(job.id) is None
+    assert other.status(job.id)["status"] == "done"
+    assert other.index_changed(check_seconds=0) is True
+    assert other.index_changed(check_seconds=0) is False
+
+
+def test_failed_batch_keeps_the_rest(tmp_path):
+    index = FakeIndex(fail_first=True)
+    queue, job, done = _upload(tmp_path, index)
+    status = _wait(queue, job)
+    assert status["status"] == "done" and len(status["errors"]) == 1
+    assert status["nodes_done"] == status["nodes_total"] - 1 == len(index.nodes)
+
+
+def test_unknown_job(tmp_path):
+    queue = IngestionQueue(FakeIndex(), spool_root=str(tmp_path / "spool"),
+                           store=JobStore(str(tmp_path / "jobs.sqlite3")))
+    assert queue.status("nope") is None
@@ -0,0 +1,11 @@
+import pytest
+
+from langid import canonical
+
+
+@pytest.mark.parametrize("tag, expected", [
+    ("en", "English"), ("en-US", "English"), ("EN_gb", "English"), ("sw-KE", "Kiswahili"),
+    ("Kiswahili", "Kiswahili"), ("sheng", "Sheng"), ("fr-FR", None), ("", None), (None, None),
+])
+def test_canonical(tag, expected):
+    assert canonical(tag) == expected
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from llm import FakeProvider, LLMBusyError, LLMClient
+
+
+def _client(latency=0.2, max_concurrency=4, timeout=5.0):
+    provider = FakeProvider(latency=latency, tokens=2)
+    return LLMClient(provider, max_concurrency=max_concurrency, timeout=timeout), provider
+
+
+def _fn(provider):
+    return lambda: provider.generate("p", timeout=1)
+
+
+def test_acall_coalesces_identical_keys():
+    client, provider = _client()
+
+    async def run():
+        return await asyncio.gather(*(client.acall("k", _fn(provider)) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["answer answer"] * 5
+    assert provider.calls == 1
+    assert client._inflight == {}
+
+
+def test_cancelled_follower_leaves_leader_and_others_intact():
+    client, provider = _client()
+
+    async def run():
+        leader = asyncio.create_task(client.acall("k", _fn(provider)))
+        await asyncio.sleep(0.05)
+        first = asyncio.create_task(client.acall("k", _fn(provider)))
+        second = asyncio.create_task(client.acall("k", _fn(provider)))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        return await asyncio.gather(leader, first, second, return_exceptions=True)
+
+    leader, first, second = asyncio.run(run())
+    assert leader == "answer answer"
+    assert isinstance(first, asyncio.CancelledError)
+    assert second == "answer answer"
+    assert provider.calls == 1
+    assert client._inflight == {}
+
+
+def test_acall_busy_releases_followers():
+    client, provider = _client(latency=0.3, max_concurrency=1, timeout=0.05)
+
+    async def run():
+        blocker = asyncio.create_task(client.acall("a", _fn(provider)))
+        await asyncio.sleep(0.01)
+        waiting = [asyncio.create_task(client.acall("b", _fn(provider))) for _ in range(2)]
+        return await asyncio.gather(blocker, *waiting, return_exceptions=True)
+
+    blocker, *waiting = asyncio.run(run())
+    assert blocker == "answer answer"
+    assert all(isinstance(r, LLMBusyError) for r in waiting)
+    assert client._inflight == {}
+
+
+def test_sync_call_propagates_errors_and_clears_key():
+    client, _ = _client(latency=0)
+
+    def boom():
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        client.call("k", boom)
+    assert client._inflight == {}
+    assert client.call("k", lambda: "ok") == "ok"
@@ -0,0 +1,55 @@
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+
+
+def _lines(name):
+    return [line for line in metrics.render().splitlines() if line.startswith(name)]
+
+
+def test_render_histogram_and_counter():
+    metrics.observe("test_render_seconds", 0.003, stage="x")
+    metrics.observe("test_render_seconds", 2.0, stage="x")
+    metrics.inc("test_render_total", 2, path='a"b\\c')
+    lines = _lines("test_render_seconds")
+    assert 'test_render_seconds_bucket{stage="x",le="0.001"} 0' in lines
+    assert 'test_render_seconds_bucket{stage="x",le="0.005"} 1' in lines
+    assert 'test_render_seconds_bucket{stage="x",le="+Inf"} 2' in lines
+    assert 'test_render_seconds_count{stage="x"} 2' in lines
+    assert _lines("test_render_total") == ['test_render_total{path="a\\"b\\\\c"} 2.0']
+    assert "# TYPE test_render_total counter" in metrics.render()
+
+
+def test_gauge_is_read_at_scrape_time():
+    value = {"n": 1}
+    metrics.gauge("test_gauge_entries", "Entries.", lambda: {(): value["n"]})
+    assert _lines("test_gauge_entries") == ["test_gauge_entries 1"]
+    value["n"] = 5
+    assert _lines("test_gauge_entries") == ["test_gauge_entries 5"]
+
+
+def test_middleware_labels_route_templates_and_timing_header():
+    app = FastAPI()
+    metrics.install(app)
+
+    @app.get("/test-items/{item_id}")
+    async def item(item_id: str):
+        with metrics.span("test_lookup"):
+            return {"id": item_id}
+
+    client = TestClient(app)
+    for i in range(3):
+        client.get(f"/test-items/{i}")
+    for i in range(3):
+        assert client.get(f"/no-such-path-{i}").status_code == 404
+    response = client.get("/test-items/9", headers={metrics.TIMING_HEADER: "1"})
+    assert re.fullmatch(r"test_lookup=[\d.]+ms;total=[\d.]+ms", response.headers[metrics.TIMING_HEADER])
+    assert metrics.TIMING_HEADER not in client.get("/test-items/9").headers
+
+    text = client.get("/metrics").text
+    assert 'shebot_request_seconds_count{path="/test-items/{item_id}"} 5' in text
+    assert f'shebot_request_seconds_count{{path="{metrics.UNMATCHED_PATH}"}}' in text
+    assert "no-such-path" not in text
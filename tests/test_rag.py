@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+import rag
+from embeddings import get_client
+
+
+@pytest.fixture(scope="module")
+def kb(tmp_path_factory):
+    patch = pytest.MonkeyPatch()
+    # Deterministic offline vectors, and no embedding cache file in the working directory
+    patch.setattr(rag, "PROVIDER", "fake")
+    patch.setattr(rag, "embed", lambda texts: get_client("fake", "fake", use_cache=False).embed(texts))
+    store = tmp_path_factory.mktemp("kb") / "knowledge.vec"
+    data = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+    csvs = [os.path.join(data, name) for name in ("knowledge.csv", "shebot_mental_health_1500.csv")]
+    yield rag.CSVKnowledgeBase(csvs, store_path=str(store), ann="exact")
+    patch.undo()
+
+
+QUERIES = ["How do I report domestic violence?", "calm down panic attack", "hello there",
+           "Niko kwa hatari, saidia", "stress at work", ""]
+
+
+def _same(a, b):
+    assert [r["Question"] for r in a] == [r["Question"] for r in b]
+    for x, y in zip(a, b):
+        # Batched and single matrix products may differ in the last float bits
+        if x["score"] is None:
+            assert y["score"] is None
+        else:
+            assert x["score"] == pytest.approx(y["score"], abs=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["hybrid", "dense", "lexical"])
+@pytest.mark.parametrize("language", [None, "auto", "sw"])
+def test_query_batch_matches_query(kb, mode, language):
+    batch = kb.query_batch(QUERIES, top_k=3, mode=mode, language=language)
+    assert len(batch) == len(QUERIES)
+    for text, results in zip(QUERIES, batch):
+        _same(results, kb.query(text, top_k=3, mode=mode, language=language))
+
+
+def test_lexical_results_have_a_relevance_floor(kb):
+    assert kb.query("hello there", mode="lexical") == []
+    top = kb.query("How do I report domestic violence?", mode="lexical")[0]
+    assert top["Question"] == "How do I report domestic violence?"
+    assert top["score"] is None and top["overlap"] == 1.0
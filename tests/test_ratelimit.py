@@ -0,0 +1,61 @@
+import sqlite3
+
+from starlette.requests import Request
+
+import ratelimit
+from ratelimit import RateLimiter, SQLiteBackend, client_key
+
+
+def test_sqlite_take_refills_and_limits(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "rl.sqlite3"))
+    assert backend.take("a", capacity=2, rate=1.0, now=0.0) == (True, 1.0)
+    assert backend.take("a", capacity=2, rate=1.0, now=0.0) == (True, 0.0)
+    assert backend.take("a", capacity=2, rate=1.0, now=0.0)[0] is False
+    assert backend.take("a", capacity=2, rate=1.0, now=1.0)[0] is True
+    assert backend.take("b", capacity=2, rate=1.0, now=1.0)[0] is True
+
+
+def test_sqlite_take_cost_is_all_or_nothing(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "rl.sqlite3"))
+    assert backend.take("a", capacity=5, rate=1.0, now=0.0, cost=4) == (True, 1.0)
+    assert backend.take("a", capacity=5, rate=1.0, now=0.0, cost=2) == (False, 1.0)
+
+
+def test_sqlite_take_fails_open_when_locked(tmp_path):
+    path = str(tmp_path / "rl.sqlite3")
+    backend = SQLiteBackend(path)
+    backend._conn().execute("PRAGMA busy_timeout = 10")
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        assert backend.take("a", capacity=1, rate=1.0, now=0.0)[0] is True
+    finally:
+        other.execute("ROLLBACK")
+
+
+def test_limiter_retry_after(tmp_path):
+    limiter = RateLimiter(per_minute=60, backend=SQLiteBackend(str(tmp_path / "rl.sqlite3")))
+    assert limiter.hit("a", cost=60)[0]
+    allowed, retry_after = limiter.hit("a")
+    assert not allowed and 0 < retry_after <= 1.0
+
+
+def _request(forwarded, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_client_key_uses_trusted_hop(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 1)
+    # The client controls everything left of what the proxy appended
+    assert client_key(_request("1.1.1.1, 2.2.2.2, 203.0.113.7")) == "203.0.113.7"
+    assert client_key(_request(None)) == "10.0.0.1"
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_PROXY_HOPS", 2)
+    assert client_key(_request("1.1.1.1, 203.0.113.7, 10.0.0.9")) == "203.0.113.7"
+    assert client_key(_request("203.0.113.7")) == "10.0.0.1"
+
+
+def test_client_key_ignores_header_without_proxy(monkeypatch):
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUST_PROXY", False)
+    assert client_key(_request("1.1.1.1")) == "10.0.0.1"
@@ -0,0 +1,69 @@
+import pytest
+
+from safety import EMERGENCY_MATCHER, detect_emergency, response_scanner, validate_safety_response
+
+
+def stream(scanner, text, size):
+    out = "".join(scanner.feed(text[i:i + size]) for i in range(0, len(text), size))
+    return out + scanner.finish()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 100])
+def test_scanner_reassembles_safe_text(size):
+    text = "abcdefghijklmnopqrstuvwxyz, stay calm and breathe slowly. " * 3
+    scanner = response_scanner()
+    assert stream(scanner, text, size) == text
+    assert scanner.match is None
+
+
+@pytest.mark.parametrize("size", [1, 4, 100])
+def test_scanner_stops_before_unsafe_keyword(size):
+    text = "Please stay calm. He said he would kill you, so leave now and call for help."
+    scanner = response_scanner()
+    out = stream(scanner, text, size)
+    assert scanner.match is not None and scanner.match.keyword == "kill"
+    assert text.startswith(out) and "kill" not in out
+    assert scanner.match.start == text.index("kill")
+
+
+def test_scanner_keyword_split_across_chunks():
+    scanner = EMERGENCY_MATCHER.scanner()
+    assert stream(scanner, "he tried to kid" + "nap me", 5) == ""
+    assert scanner.match.keyword == "kidnap"
+
+
+@pytest.mark.parametrize("text", ["I was raped yesterday", "he assaulted me", "I was kidnapped", "I am abused",
+                                  "he threatened me", "I am being stalked", "niko hatarini", "nisaidie tafadhali"])
+def test_emergency_inflections(text):
+    assert detect_emergency(text)
+
+
+@pytest.mark.parametrize("text", ["this is helpful", "my head hurts", "a skillful therapist"])
+def test_emergency_deliberate_exclusions(text):
+    assert not detect_emergency(text)
+
+
+@pytest.mark.parametrize("text", ["He killed her", "share your locations", "It was violent"])
+def test_unsafe_response_inflections(text):
+    assert not validate_safety_response(text)[0]
+
+
+@pytest.mark.parametrize("text", ["This is a skill worth learning", "The allocation of funds"])
+def test_unsafe_response_word_boundaries(text):
+    assert validate_safety_response(text) == (True, None)
+
+
+def test_emergency_privacy_notice_follows_audit_setting(monkeypatch):
+    from safety import AUDITED_PRIVACY_NOTICES, PRIVACY_NOTICES, emergency_response, audit_log
+    monkeypatch.setattr(audit_log, "enabled", False)
+    assert emergency_response()["en"].endswith("no data is stored.")
+    monkeypatch.setattr(audit_log, "enabled", True)
+    for key, text in emergency_response().items():
+        assert "999" in text and "1195" in text
+        assert text.endswith(AUDITED_PRIVACY_NOTICES[key]) and PRIVACY_NOTICES[key] not in text
+
+
+def test_with_hotlines_puts_reminder_first():
+    from safety import HOTLINE_REMINDERS, with_hotlines
+    assert with_hotlines("Breathe slowly.", "sw") == f"{HOTLINE_REMINDERS['sw']} Breathe slowly."
+    assert with_hotlines("Call 999.", None).startswith(HOTLINE_REMINDERS["en"])
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from vector_store import VectorStore, open_store, write_store
+
+
+def _vectors(rows=20, dim=16):
+    return np.random.default_rng(0).standard_normal((rows, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-6), ("float16", 1e-3), ("int8", 1e-2)])
+def test_round_trip(tmp_path, dtype, tolerance):
+    vectors = _vectors()
+    hashes = [f"h{i}" for i in range(len(vectors))]
+    path = str(tmp_path / "kb.vec")
+    write_store(path, vectors, hashes, model="m", dtype=dtype, extra={"source": "test"})
+
+    store = VectorStore(path)
+    assert (store.rows, store.dim, store.dtype, store.model) == (20, 16, dtype, "m")
+    assert store.hashes == hashes and store.header["source"] == "test"
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.testing.assert_allclose(store.matrix(), unit, atol=tolerance)
+    found = store.vectors_for(["h3", "missing", "h0"])
+    assert set(found) == {"h3", "h0"}
+    np.testing.assert_allclose(found["h3"], unit[3], atol=tolerance)
+
+
+def test_float32_store_is_memory_mapped(tmp_path):
+    path = str(tmp_path / "kb.vec")
+    write_store(path, _vectors(), [f"h{i}" for i in range(20)], model="m")
+    assert isinstance(VectorStore(path).matrix(), np.memmap)
+
+
+def test_rejects_bad_input(tmp_path):
+    with pytest.raises(ValueError):
+        write_store(str(tmp_path / "a.vec"), _vectors(), ["h"] * 3, model="m")
+    with pytest.raises(ValueError):
+        write_store(str(tmp_path / "a.vec"), _vectors(), [f"h{i}" for i in range(20)], model="m", dtype="bf16")
+
+
+def test_open_store_ignores_missing_and_corrupt(tmp_path):
+    assert open_store(str(tmp_path / "missing.vec")) is None
+    corrupt = tmp_path / "corrupt.vec"
+    corrupt.write_bytes(b"not a store")
+    assert open_store(str(corrupt)) is None
@@ -0,0 +1,140 @@
+import json
+import os
+import struct
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# File layout:
+#   MAGIC | u32 header length | JSON header | zero padding to ALIGN | vectors [| int8 row scales]
+# Vectors are unit length, so a float32 store can be searched straight off the memmap.
+MAGIC = b"SHEVEC1\0"
+ALIGN = 64
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16", "int8")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_store(path: str, vectors: np.ndarray, hashes: List[str], model: str, dtype: str = "float32",
+                extra: Optional[Dict] = None) -> None:
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported store dtype: {dtype}")
+    vectors = _normalize(np.atleast_2d(vectors))
+    if vectors.shape[0] != len(hashes):
+        raise ValueError(f"{vectors.shape[0]} vectors but {len(hashes)} hashes")
+
+    scales = None
+    if dtype == "int8":
+        # Symmetric per-row quantization; the scale restores the original magnitude
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        payload = np.round(vectors / scales[:, None]).astype(np.int8)
+        scales = scales.astype(np.float32)
+    else:
+        payload = vectors.astype(dtype)
+
+    header = {
+        "format": FORMAT_VERSION,
+        "model": model,
+        "dim": int(vectors.shape[1]) if vectors.size else 0,
+        "dtype": dtype,
+        "rows": len(hashes),
+        "hashes": list(hashes),
+        **(extra or {}),
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix = len(MAGIC) + 4 + len(header_bytes)
+    padding = (-prefix) % ALIGN
+
+    # Write to a temp file and rename, so workers that have the old file mapped keep a valid view
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * padding)
+        f.write(np.ascontiguousarray(payload).tobytes())
+        if scales is not None:
+            f.write(scales.tobytes())
+    os.replace(tmp_path, path)
+
+
+class VectorStore:
+    """Read-only view of a store file; the payload is np.memmap'd, not read into RAM."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a vector store file: {path}")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(header_len).decode("utf-8"))
+        if self.header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format in {path}")
+
+        offset = len(MAGIC) + 4 + header_len
+        offset += (-offset) % ALIGN
+        shape = (self.rows, self.dim)
+        self.payload = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=shape) if self.rows else \
+            np.empty(shape, dtype=self.dtype)
+        self.scales = None
+        if self.dtype == "int8" and self.rows:
+            self.scales = np.memmap(path, dtype=np.float32, mode="r",
+                                    offset=offset + self.rows * self.dim, shape=(self.rows,))
+
+    @property
+    def model(self) -> str:
+        return self.header["model"]
+
+    @property
+    def dim(self) -> int:
+        return self.header["dim"]
+
+    @property
+    def dtype(self) -> str:
+        return self.header["dtype"]
+
+    @property
+    def rows(self) -> int:
+        return self.header["rows"]
+
+    @property
+    def hashes(self) -> List[str]:
+        return self.header["hashes"]
+
+    def matrix(self) -> np.ndarray:
+        """float32 unit vectors. Zero-copy (shared page cache) for float32 stores;
+        float16/int8 stores are decoded into process memory."""
+        if self.dtype == "float32":
+            return self.payload
+        if self.dtype == "float16":
+            return np.asarray(self.payload, dtype=np.float32)
+        return self.payload.astype(np.float32) * np.asarray(self.scales)[:, None]
+
+    def vectors_for(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Decoded vectors for whichever of `hashes` the store already holds."""
+        position = {h: i for i, h in enumerate(self.hashes)}
+        wanted = [(h, position[h]) for h in hashes if h in position]
+        if not wanted:
+            return {}
+        rows = np.array([i for _, i in wanted])
+        decoded = np.asarray(self.payload[rows], dtype=np.float32)
+        if self.scales is not None:
+            decoded *= np.asarray(self.scales[rows])[:, None]
+        return {h: decoded[j] for j, (h, _) in enumerate(wanted)}
+
+
+def open_store(path: str) -> Optional[VectorStore]:
+    if not os.path.exists(path):
+        return None
+    try:
+        return VectorStore(path)
+    except (OSError, ValueError) as e:
+        print(f"[WARN] Ignoring unreadable vector store {path}: {e}")
+        return None